@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Time per iteration and stacks allocated per iteration for the combinators
+that evaluate quotations in isolation.
+
+    python3 benchmarks/combinators.py [n_iter]
+"""
+
+import sys
+import time
+
+from bok import stack as st
+from bok.parser import Machine
+
+
+# Each program runs its combinator `n` times.
+PROGRAMS = {
+    'if':     '0 {n} [[dup 0 >] [1 +] [1 -] if] repeat',
+    'when':   '0 {n} [[dup 0 >=] [1 +] when] repeat',
+    'unless': '0 {n} [[dup 0 <] [1 +] unless] repeat',
+    'cond':   '0 {n} [[[[0 <] [1 -]] [[0 >=] [1 +]]] cond] repeat',
+    'while':  '0 [dup {n} <] [1 +] while',
+    'linrec': '{n} [0 ==] [] [1 -] [] linrec',
+    'map':    '{n} range [1 +] map',
+    'filter': '{n} range [2 % 0 ==] filter',
+}
+
+
+class CountingStack(st.Stack):
+    count = 0
+
+    def __init__(self, *args, **kwargs):
+        CountingStack.count += 1
+        super().__init__(*args, **kwargs)
+
+
+def run(text, optimize):
+    machine = Machine(optimize=optimize)
+    machine.parse(text)
+    CountingStack.count = 0
+    start = time.perf_counter()
+    machine.run()
+    return time.perf_counter() - start, CountingStack.count
+
+
+def main(n_iter=20000):
+    # Count the stacks built by combinators, not the machine's own.
+    st.Stack = CountingStack
+    print('{0:8} {1:>12} {2:>14}'.format('', 'us/iter', 'stacks/iter'))
+    for name, text in PROGRAMS.items():
+        elapsed, count = run(text.format(n=n_iter), optimize=False)
+        print('{0:8} {1:12.3f} {2:14.4f}'.format(
+                name, 1e6 * elapsed / n_iter, count / n_iter))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Parse time and peak memory for a large generated Bok file.
+
+    python3 benchmarks/parse_large.py [n_lines]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from bok.parser import Machine
+
+
+def generate(n_lines):
+    lines = []
+    for ii in range(n_lines):
+        kind = ii % 4
+        if kind == 0:
+            lines.append('( w{0}  dup * {0} + [1 -] exec )'.format(ii))
+        elif kind == 1:
+            items = ' '.join(str(jj) for jj in range(ii % 50))
+            lines.append('[{0}] len drop'.format(items))
+        elif kind == 2:
+            lines.append('( ns{0} ( inner  {0} 2 * ) ( outer  inner 1 + ) )'.format(ii))
+        else:
+            lines.append('"line {0}" drop {0}.5 drop'.format(ii))
+    return '\n'.join(lines)
+
+
+def main(n_lines=10000):
+    text = generate(n_lines)
+    machine = Machine()
+    machine.parse('1')  # build the parser outside of the measurement
+    tracemalloc.start()
+    start = time.perf_counter()
+    machine.parse(text)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('lines     : {0}'.format(n_lines))
+    print('parse     : {0:.3f} s'.format(elapsed))
+    print('peak mem  : {0:.1f} MiB'.format(peak / 2**20))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
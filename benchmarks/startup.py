@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Interpreter startup time: the `-X importtime` breakdown of importing the
+batch runner, and the wall time of `bok run` on a trivial script.
+
+    python3 benchmarks/startup.py [n_runs]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+
+def import_times(module='bok.runner'):
+    """
+    Run `python -X importtime -c 'import <module>'` and return a dict of
+    cumulative import time in µs by module name.
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        stderr=subprocess.PIPE, universal_newlines=True, check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def run_time(n_runs=10):
+    """
+    Best wall time in seconds of `python -m bok run` on a one line script.
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.bok', delete=False) as f:
+        f.write('1 2 + drop\n')
+    try:
+        best = float('inf')
+        for _ in range(n_runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-m', 'bok', 'run', f.name],
+                           check=True)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        os.remove(f.name)
+    return best
+
+
+def main(n_runs=10):
+    times = import_times()
+    total = times['bok.runner']
+    print('import bok.runner : {0:.1f} ms'.format(total / 1e3))
+    for name in ('numpy', 'lark', 'termcolor', 'prompt_toolkit', 'pygments'):
+        if name in times:
+            print('  {0:15} : {1:.1f} ms'.format(name, times[name] / 1e3))
+        else:
+            print('  {0:15} : not imported'.format(name))
+    print('bok run (best)    : {0:.1f} ms'.format(1e3 * run_time(n_runs)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
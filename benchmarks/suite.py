@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the interpreter's hot paths: parsing, builtin and word
+dispatch, the combinators, the recursive words of `lib/examples.bok`, NumPy
+interop through `@` calls, importing a Bok module from source and from its
+`.bokc` cache, and the import cost of the interpreter itself. Each case reports the best time
+of several runs. Results are written as JSON so that runs on different
+commits can be compared.
+
+    python3 benchmarks/suite.py [-o results.json] [--compare old.json]
+"""
+
+import os
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from bok.parser import Machine, compiled_files
+
+import combinators
+import parse_large
+import startup
+
+
+EXAMPLES_FILEN = os.path.join(os.path.dirname(__file__), os.pardir, 'lib',
+                              'examples.bok')
+
+# Programs timed as `(group, name, text, n)`, where `text` does `n` units of
+# work and the result is reported per unit.
+PROGRAMS = [
+    ('dispatch', 'builtin',  '0 {n} [1 +] repeat', 100000),
+    ('dispatch', 'shuffle',  '1 2 {n} [swap over drop] repeat', 100000),
+    ('dispatch', 'word',     '( inc 1 + ) 0 {n} [inc] repeat', 100000),
+    ('dispatch', 'variable', '( keep_x :x x ) 0 {n} [keep_x] repeat', 100000),
+    *[('combinator', name, text, 20000)
+      for name, text in combinators.PROGRAMS.items()],
+    ('combinator', 'fold',   '{n} range 0 [+] fold', 20000),
+    ('examples', 'factorial',       '{n} [100 factorial drop] repeat', 200),
+    ('examples', 'factorial_naive', '{n} [100 factorial_naive drop] repeat', 200),
+    ('examples', 'dub_or_neg',      '{n} range dub_or_neg', 20000),
+    ('numpy', 'call',    '{n} [2.0 @sqrt drop] repeat', 20000),
+    ('numpy', 'map',     '{n} @arange [2 * 1 +] map', 100000),
+    ('numpy', 'filter',  '{n} @arange [3 % 0 ==] filter', 100000),
+]
+
+with open(EXAMPLES_FILEN, 'r') as f:
+    EXAMPLES = f.read()
+
+
+def best_of(func, n_repeat):
+    return min(func() for _ in range(n_repeat))
+
+
+def time_program(group, text, n, optimize=True):
+    machine = Machine(optimize=optimize)
+    if group == 'examples':
+        machine.parse(EXAMPLES)
+    machine.parse(text.format(n=n))
+    start = time.perf_counter()
+    machine.run()
+    return time.perf_counter() - start
+
+
+def time_parse(n_lines):
+    text = parse_large.generate(n_lines)
+    machine = Machine()
+    machine.parse('1')  # build the parser outside of the measurement
+    start = time.perf_counter()
+    machine.parse(text)
+    return time.perf_counter() - start
+
+
+def time_import(n_lines, warm):
+    """
+    Time `"lib" import` of a generated module of `n_lines` lines, either
+    parsed from source, with no `.bokc` cache to load (and one written), or
+    loaded from the cache left by an earlier import.
+    """
+    with tempfile.TemporaryDirectory() as dirn:
+        path = os.path.join(dirn, 'lib.bok')
+        with open(path, 'w') as f:
+            f.write(parse_large.generate(n_lines))
+        text = '"{0}" import'.format(path)
+        # Each `Machine` has its own module registry, so every import below
+        # goes to the cache or the source rather than to an earlier table.
+        Machine().parse(text)  # build the parser and the cache
+        if not warm:
+            for filen in compiled_files(path):
+                if os.path.exists(filen):
+                    os.remove(filen)
+        machine = Machine()
+        start = time.perf_counter()
+        machine.parse(text)
+        return time.perf_counter() - start
+
+
+def run_suite(n_repeat=5, pattern=''):
+    """
+    Run every case whose `group.name` contains `pattern`, returning a dict
+    of `{'group.name': {'seconds', 'n', 'us_per_op'}}`.
+    """
+    cases = [
+        (group, name, lambda g=group, t=text, n=n: time_program(g, t, n), n)
+        for group, name, text, n in PROGRAMS
+    ]
+    cases.append(('parse', 'lines', lambda: time_parse(10000), 10000))
+    cases.append(('import', 'cold', lambda: time_import(2000, False), 2000))
+    cases.append(('import', 'warm', lambda: time_import(2000, True), 2000))
+    results = {}
+    for group, name, func, n in cases:
+        key = '{0}.{1}'.format(group, name)
+        if pattern not in key:
+            continue
+        seconds = best_of(func, n_repeat)
+        results[key] = {
+            'seconds': seconds,
+            'n': n,
+            'us_per_op': 1e6 * seconds / n,
+        }
+    key = 'import.runner'
+    if pattern in key:
+        seconds = startup.import_times()['bok.runner'] / 1e6
+        results[key] = {'seconds': seconds, 'n': 1, 'us_per_op': 1e6 * seconds}
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], universal_newlines=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, previous=None):
+    previous = {} if previous is None else previous
+    print('{0:32} {1:>12} {2:>8}'.format('', 'us/op', 'ratio'))
+    for key, result in results.items():
+        ratio = ''
+        if key in previous:
+            ratio = '{0:.2f}'.format(
+                    result['us_per_op'] / previous[key]['us_per_op'])
+        print('{0:32} {1:12.3f} {2:>8}'.format(key, result['us_per_op'], ratio))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument('-o', '--output', metavar='FILE',
+                            help='write the results to FILE as JSON')
+    arg_parser.add_argument('--compare', metavar='FILE',
+                            help='show the ratio to the results in FILE')
+    arg_parser.add_argument('-r', '--repeat', type=int, default=5,
+                            help='runs per case, the best is kept')
+    arg_parser.add_argument('-k', '--pattern', default='',
+                            help='only run cases whose name contains this')
+    args = arg_parser.parse_args()
+    results = run_suite(args.repeat, args.pattern)
+    previous = None
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            previous = json.load(f)['results']
+    print_results(results, previous)
+    if args.output is not None:
+        report = {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,4 +3,40 @@
 Python implementation of the Bok programming language.
 """
 
-import numpy as array_module
+__version__ = '0.1'
+
+import sys
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported on first attribute access,
+    so that programs which never use it do not pay for importing it.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    @property
+    def loaded(self):
+        return self._module is not None or self._name in sys.modules
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return '<lazy module {0!r}>'.format(self._name)
+
+
+array_module = LazyModule('numpy')
+
+
+def is_array(obj):
+    """
+    Whether an object is an array, without importing the array module: if
+    it has not been imported, no object can be one of its arrays.
+    """
+    return array_module.loaded and isinstance(obj, array_module.ndarray)
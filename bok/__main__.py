@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+
+import sys
+
+from .runner import main
+
+
+sys.exit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Compile lists of ops into Python functions.
+
+A word body or quotation is a list of literals and callables. Rather than
+walk that list and test `callable(op)` on every call, the list is turned
+once into the source of a function where literals are pushed directly and
+callables are called directly, each bound as a closure variable. Late-bound
+calls are made through their linked `target` attribute.
+
+Runs of literals and the pure builtins listed in `bok.stack.INLINE_OPS`,
+eg the arithmetic in `dup 1 + *`, are compiled further into straight-line
+code on Python locals: the items below the run are popped as they are
+needed, each builtin becomes an expression, and only what is left at the
+end of the run is pushed. Numeric kernels then cost a few bytecodes per op
+instead of a call and several stack accesses.
+"""
+
+import itertools
+
+
+class InlineBlock:
+    """
+    Code of a run of inlined ops. The items the run leaves are tracked as
+    the names of locals rather than pushed.
+    """
+    def __init__(self, names):
+        self.names = names
+        self.items = []
+        self.lines = []
+
+    def take(self, n):
+        """
+        Names of the top `n` items, deepest first, popping any that are
+        still on the stack.
+        """
+        while len(self.items) < n:
+            name = next(self.names)
+            self.lines.append('{0} = pop()'.format(name))
+            self.items.insert(0, name)
+        taken = self.items[len(self.items)-n:]
+        del self.items[len(self.items)-n:]
+        return taken
+
+    def apply(self, n_in, exprs):
+        args = self.take(n_in)
+        for expr in exprs:
+            expr = expr.format(*args)
+            if expr not in args:
+                name = next(self.names)
+                self.lines.append('{0} = {1}'.format(name, expr))
+                expr = name
+            self.items.append(expr)
+
+    def flush(self):
+        lines = self.lines + ['push({0})'.format(item) for item in self.items]
+        self.items = []
+        self.lines = []
+        return lines
+
+
+def compile_ops(ops, name='_compiled'):
+    """
+    Compile a list of ops into a function of a single `stack` argument.
+    """
+    from .stack import INLINE_OPS
+    params = []
+    body = []
+    block = InlineBlock('_t{0}'.format(ii) for ii in itertools.count())
+    for ii, op in enumerate(ops):
+        param = '_op{0}'.format(ii)
+        params.append(param)
+        if getattr(op, 'late_bound', False):
+            body.extend(block.flush())
+            body.append('{0}.target(stack)'.format(param))
+        elif callable(op):
+            try:
+                inline = INLINE_OPS.get(op)
+            except TypeError:
+                inline = None
+            if inline is None:
+                body.extend(block.flush())
+                body.append('{0}(stack)'.format(param))
+            else:
+                block.apply(*inline)
+        else:
+            block.items.append(param)
+    body.extend(block.flush())
+    if body:
+        body.insert(0, 'push = stack.append')
+        body.insert(1, 'pop = stack.pop')
+    else:
+        body.append('pass')
+    lines = [
+        'def _factory({0}):'.format(', '.join(params)),
+        '    def _compiled(stack):',
+        *['        ' + line for line in body],
+        '    return _compiled',
+    ]
+    namespace = {}
+    exec('\n'.join(lines), namespace)
+    func = namespace['_factory'](*ops)
+    func.__name__ = func.__qualname__ = name
+    return func
+
+
+class Quotation(list):
+    """
+    A literal quotation, ie `[..]`. Behaves as a plain list but memoizes its
+    compiled form for use by the combinators. Any in-place mutation discards
+    the compiled form so that it is rebuilt on the next call. If an
+    `optimizer` is attached, it is applied to the compiled form only, so the
+    quotation's contents as data are unchanged.
+    """
+    __slots__ = ('_code', 'optimizer')
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._code = None
+        self.optimizer = None
+
+    @property
+    def code(self):
+        if self._code is None:
+            ops = self
+            if self.optimizer is not None:
+                ops = self.optimizer.optimize(ops)
+            self._code = compile_ops(ops)
+        return self._code
+
+    def __reduce__(self):
+        # Items are restored after the quotation itself is created so that
+        # quotations reachable from their own contents pickle correctly.
+        return (self.__class__, (), {'optimizer': self.optimizer}, iter(self))
+
+    def __setstate__(self, state):
+        self.optimizer = state['optimizer']
+
+    def _invalidating(method):
+        def wrapped(self, *args, **kwargs):
+            self._code = None
+            return method(self, *args, **kwargs)
+        wrapped.__name__ = method.__name__
+        wrapped.__doc__ = method.__doc__
+        return wrapped
+
+    append = _invalidating(list.append)
+    extend = _invalidating(list.extend)
+    insert = _invalidating(list.insert)
+    pop = _invalidating(list.pop)
+    remove = _invalidating(list.remove)
+    clear = _invalidating(list.clear)
+    sort = _invalidating(list.sort)
+    reverse = _invalidating(list.reverse)
+    __setitem__ = _invalidating(list.__setitem__)
+    __delitem__ = _invalidating(list.__delitem__)
+    __iadd__ = _invalidating(list.__iadd__)
+    __imul__ = _invalidating(list.__imul__)
+    del _invalidating
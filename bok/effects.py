@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Static stack effects.
+
+The builtins document their stack effect in the first lines of their
+docstrings, eg `( a b -- c )`. These are parsed into an `Effect` of how many
+items an op takes and leaves. Effects of word bodies are inferred by walking
+their ops: literals leave one item, variables take or leave one, and fused
+conditionals have the effect of their branches when the branches agree.
+Anything whose effect depends on the data, eg `..` in a signature, `exec`
+or a combinator applied to quotations only known at run time, has no effect
+and inference stops there.
+
+A user word may declare its effect with a docstring in the same form. The
+declaration is checked against the inferred effect when the word is parsed,
+and is used for the word when nothing could be inferred.
+"""
+
+import re
+from collections import namedtuple
+
+from .wrappers import FusedCond, FusedIf, PyWr, TailCall, VarWr, WordWr
+
+
+class StackEffectError(RuntimeError):
+    pass
+
+
+Effect = namedtuple('Effect', 'n_in n_out')
+
+# Result of inference: `effect` is None unless it is known for every op, and
+# `requires` is the number of items the ops need on entry as far as their
+# effects are known.
+Inferred = namedtuple('Inferred', 'effect requires')
+
+EFFECT_LINE = re.compile(r'^\s*\((.*)--(.*)\)\s*$')
+
+OPENING = '[(<'
+CLOSING = '])>'
+
+# Effects of builtin functions parsed from their docstrings, by function.
+_BUILTIN_EFFECTS = {}
+
+
+def split_items(side):
+    """
+    Split one side of a signature into items, keeping bracketed groups such
+    as `[a b]` or `f(a, b)` together.
+    """
+    items = []
+    item = ''
+    depth = 0
+    for char in side:
+        if char in OPENING:
+            depth += 1
+        elif char in CLOSING:
+            depth -= 1
+        if char.isspace() and depth == 0:
+            if item:
+                items.append(item)
+            item = ''
+        else:
+            item += char
+    if item:
+        items.append(item)
+    return items
+
+
+def parse_side(side):
+    items = split_items(side)
+    if any(item == '..' or item.startswith('!') for item in items):
+        return None
+    return len(items)
+
+
+def parse_effect(doc):
+    """
+    Effect declared in a docstring, or None if there is none or its
+    signatures disagree or depend on the data.
+    """
+    if not doc:
+        return None
+    effect = None
+    for line in doc.splitlines():
+        match = EFFECT_LINE.match(line)
+        if match is None:
+            continue
+        n_in, n_out = [parse_side(side) for side in match.groups()]
+        if n_in is None or n_out is None:
+            return None
+        if effect is not None and effect != (n_in, n_out):
+            return None
+        effect = Effect(n_in, n_out)
+    return effect
+
+
+def builtin_effect(func):
+    try:
+        return _BUILTIN_EFFECTS[func]
+    except KeyError:
+        effect = _BUILTIN_EFFECTS[func] = parse_effect(func.__doc__)
+        return effect
+
+
+def format_effect(effect):
+    return '( {0} -- {1} )'.format(
+        ' '.join('a{0}'.format(ii) for ii in range(effect.n_in)),
+        ' '.join('b{0}'.format(ii) for ii in range(effect.n_out)),
+    )
+
+
+def branch_effect(quotes):
+    """
+    Effect of running one of several quotations, which is known when they
+    all change the height of the stack by the same amount.
+    """
+    effects = [infer(quote).effect for quote in quotes]
+    if None in effects:
+        return None
+    if len({effect.n_out - effect.n_in for effect in effects}) != 1:
+        return None
+    n_in = max(effect.n_in for effect in effects)
+    return Effect(n_in, n_in + effects[0].n_out - effects[0].n_in)
+
+
+def op_effect(op):
+    """
+    Effect of a single op, or None if it is not known.
+    """
+    if not callable(op):
+        return Effect(0, 1)
+    if isinstance(op, WordWr):
+        return op.effect
+    if isinstance(op, VarWr):
+        return Effect(0, 1)
+    if isinstance(getattr(op, '__self__', None), VarWr):
+        return Effect(1, 0)
+    if isinstance(op, FusedIf):
+        empty = []
+        return branch_effect([op.true_q or empty, op.false_q or empty])
+    if isinstance(op, FusedCond):
+        return branch_effect([expr for _, expr in op.pairs] + [[]])
+    if isinstance(op, (TailCall, PyWr)) or getattr(op, 'late_bound', False):
+        return None
+    return builtin_effect(op)
+
+
+def infer(ops):
+    """
+    Infer the effect of a list of ops as an `Inferred`.
+    """
+    depth = 0
+    lowest = 0
+    for op in ops:
+        effect = op_effect(op)
+        if effect is None:
+            return Inferred(None, -lowest)
+        depth -= effect.n_in
+        lowest = min(lowest, depth)
+        depth += effect.n_out
+    return Inferred(Effect(-lowest, depth - lowest), -lowest)
+
+
+def check_word(word):
+    """
+    Set the `effect` of a newly built word from its body, checking it
+    against the effect declared in its docstring.
+    """
+    declared = parse_effect(word.__doc__)
+    inferred = infer(word.code_ops).effect
+    if declared is not None and inferred is not None:
+        # A declaration may name items that are passed through untouched.
+        extra = declared.n_in - inferred.n_in
+        if extra < 0 or declared.n_out - inferred.n_out != extra:
+            raise StackEffectError(
+                '"{0}" is declared {1} but its body is {2}'.format(
+                word.__name__, format_effect(declared),
+                format_effect(inferred)))
+    word.effect = declared if declared is not None else inferred
+    return word.effect
+
+
+def check_program(ops, height):
+    """
+    Raise a `StackEffectError` if top level code is certain to run out of
+    items when started on a stack of `height` items.
+    """
+    requires = infer(ops).requires
+    if requires > height:
+        raise StackEffectError(
+            'stack underflow: needs {0} items but {1} are on the stack'.format(
+            requires, height))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Bounded-size summaries of stack items for display. Containers are only
+formatted item by item for as long as there is room, and arrays are
+described by their shape and dtype, so that the cost of showing a value
+does not grow with its size.
+
+`FORMATTER` holds the limits used by `stack` and the printing words, and
+may be changed to show more or less.
+"""
+
+from types import FunctionType, ModuleType
+from collections import deque
+
+from . import array_module, is_array
+
+
+ELLIPSIS = '...'
+
+CONTAINERS = (list, tuple, deque, set, frozenset, dict)
+
+SEQUENCE_BRACKETS = {
+    list: '[]',
+    tuple: '()',
+    deque: '[]',
+    set: '{}',
+    frozenset: '{}',
+}
+
+
+def truncate(text, width):
+    text = text[:width+1].replace('\n', ' ').replace('\t', ' ')
+    if len(text) <= width:
+        return text
+    return text[:max(width - len(ELLIPSIS), 0)] + ELLIPSIS
+
+
+def summarize_items(items, length, brackets, width):
+    """
+    Join the summaries of `items` inside `brackets` until `width` is used
+    up, noting how many of the `length` items were left out.
+    """
+    parts = []
+    used = 2
+    for item in items:
+        part = summarize(item, width - used)
+        used += len(part) + 2
+        if used > width and parts:
+            break
+        parts.append(part)
+    n_left = length - len(parts)
+    if n_left:
+        parts.append('{0} +{1}'.format(ELLIPSIS, n_left))
+    return brackets[0] + ', '.join(parts) + brackets[1]
+
+
+def summarize_array(array, stats=False):
+    text = 'array{0} {1}'.format(array.shape, array.dtype)
+    # Statistics of a memory mapped array would read the whole file.
+    if isinstance(array, array_module.memmap):
+        return text + ' mapped'
+    if stats and array.size:
+        try:
+            text += ' min={0} max={1}'.format(array.min(), array.max())
+        except (TypeError, ValueError):
+            pass
+    return text
+
+
+def summarize(value, width=24, stats=False):
+    """
+    Description of a value in about `width` characters at most. With
+    `stats` set, arrays are also described by their minimum and maximum,
+    which takes a pass over the data.
+    """
+    if is_array(value):
+        return summarize_array(value, stats)
+    for kind, brackets in SEQUENCE_BRACKETS.items():
+        if isinstance(value, kind):
+            return summarize_items(value, len(value), brackets, width)
+    if isinstance(value, dict):
+        items = ('{0}: {1}'.format(summarize(k, width // 2),
+                                   summarize(v, width // 2))
+                 for k, v in value.items())
+        return summarize_items(items, len(value), '{}', width)
+    if isinstance(value, (FunctionType, ModuleType)):
+        return truncate(value.__name__, width)
+    return truncate(str(value), width)
+
+
+class Formatter:
+    """
+    Limits for showing values: `stack` shows the top `depth` items, each in
+    about `width` characters or in full for arrays of up to `array_items`
+    elements, and printing shows containers with more than `max_items` items
+    as a summary. By default `max_items` is None, so printing is never
+    shortened, since the output of a script is its result. The REPL sets it.
+    """
+    def __init__(self, depth=20, width=60, array_items=25, max_items=None):
+        self.depth = depth
+        self.width = width
+        self.array_items = array_items
+        self.max_items = max_items
+
+    def is_large(self, value):
+        if self.max_items is None:
+            return False
+        if is_array(value):
+            return value.size > self.max_items
+        return isinstance(value, CONTAINERS) and len(value) > self.max_items
+
+    def format_item(self, value):
+        """
+        Text of a stack item, which is a bounded summary unless it is a
+        small array, shown in full as NumPy lays it out.
+        """
+        if is_array(value) and value.size <= self.array_items:
+            return str(value)
+        return summarize(value, self.width, stats=True)
+
+    def format_output(self, value):
+        """
+        Text of a printed value, which is `str(value)` unless it is a
+        container of more than `max_items` items.
+        """
+        if self.is_large(value):
+            return summarize(value, self.width, stats=True)
+        return str(value)
+
+
+FORMATTER = Formatter()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Peephole optimization of reduced op lists.
+
+Ops are fed one at a time onto an output list and the tail of that list is
+matched against the rewrite rules below until none apply, so that rewrites
+cascade (eg `2 3 + 4 *` folds to `20`). Rules only ever match the builtin
+functions themselves, so a user word that shadows a builtin name is left
+alone.
+"""
+
+from collections import Counter
+
+from . import stack as st
+from .wrappers import fuse_conditional
+
+
+LITERAL_TYPES = (int, float, complex, bool)
+
+BINARY_FOLDS = {
+    st.plus, st.minus, st.mul, st.power, st.div, st.floor_div, st.mod,
+    st.bit_and, st.bit_or, st.bit_xor, st.bit_lshift, st.bit_rshift,
+    st.eq, st.ne, st.gt, st.ge, st.lt, st.le, st.and_, st.or_, st.xor,
+}
+
+UNARY_FOLDS = {
+    st.negate, st.bit_not, st.not_, st.increment, st.decrement,
+    st.cast_bool, st.cast_int, st.cast_float, st.abs_,
+}
+
+# Folding these with a large right operand would build huge integers at
+# compile time.
+GROWING_FOLDS = {st.power, st.bit_lshift}
+MAX_GROWING_OPERAND = 64
+
+SEQUENCES = [
+    ('square',    (st.dup, st.mul),    st.square),
+    ('double',    (st.dup, st.plus),   st.double),
+    ('nip',       (st.swap, st.drop),  st.nip),
+    ('over_plus', (st.over, st.plus),  st.over_plus),
+    ('drop2',     (st.drop, st.drop),  st.drop2),
+]
+
+LITERAL_ONE = [
+    ('plus_one',  st.plus,  st.plus_one),
+    ('minus_one', st.minus, st.minus_one),
+]
+
+
+def is_literal(op):
+    return type(op) in LITERAL_TYPES
+
+
+def is_builtin(op, builtins):
+    return callable(op) and op in builtins
+
+
+def evaluate(func, *values):
+    """
+    Run a builtin on literal values, returning the stack top or raising
+    `ValueError` if the builtin raised anything.
+    """
+    sub_stack = st.Stack(values)
+    try:
+        func(sub_stack)
+    except Exception as e:
+        raise ValueError(e)
+    return sub_stack[-1]
+
+
+def fold_binary(ops):
+    if len(ops) < 3 or not is_builtin(ops[-1], BINARY_FOLDS):
+        return None
+    func, lhs, rhs = ops[-1], ops[-3], ops[-2]
+    if not (is_literal(lhs) and is_literal(rhs)):
+        return None
+    if func in GROWING_FOLDS and abs(rhs) > MAX_GROWING_OPERAND:
+        return None
+    try:
+        value = evaluate(func, lhs, rhs)
+    except ValueError:
+        return None
+    ops[-3:] = [value]
+    return 'fold'
+
+
+def fold_unary(ops):
+    if len(ops) < 2 or not is_builtin(ops[-1], UNARY_FOLDS):
+        return None
+    if not is_literal(ops[-2]):
+        return None
+    try:
+        value = evaluate(ops[-1], ops[-2])
+    except ValueError:
+        return None
+    ops[-2:] = [value]
+    return 'fold'
+
+
+def literal_one(ops):
+    if len(ops) < 2 or type(ops[-2]) is not int or ops[-2] != 1:
+        return None
+    for name, func, fused in LITERAL_ONE:
+        if ops[-1] is func:
+            ops[-2:] = [fused]
+            return name
+    return None
+
+
+def sequence(ops):
+    for name, pattern, fused in SEQUENCES:
+        n = len(pattern)
+        if len(ops) < n:
+            continue
+        if all(op is func for op, func in zip(ops[-n:], pattern)):
+            ops[-n:] = [fused]
+            return name
+    return None
+
+
+def fuse(ops):
+    fused = fuse_conditional(ops)
+    if fused is None:
+        return None
+    n, op = fused
+    ops[-n:] = [op]
+    return 'fuse_' + op.__name__
+
+
+RULES = [fold_binary, fold_unary, literal_one, sequence, fuse]
+
+
+class Optimizer:
+    """
+    Apply the peephole rules to op lists, counting how often each fires in
+    `stats`.
+    """
+    def __init__(self, rules=None):
+        self.rules = RULES if rules is None else rules
+        self.stats = Counter()
+
+    def optimize(self, ops):
+        out = []
+        for op in ops:
+            out.append(op)
+            while self._rewrite(out):
+                pass
+        return out
+
+    def _rewrite(self, ops):
+        for rule in self.rules:
+            name = rule(ops)
+            if name is not None:
+                self.stats[name] += 1
+                return True
+        return False
+
+    def report(self):
+        if not self.stats:
+            return 'no rewrites'
+        return '\n'.join(
+            '{0:12} {1}'.format(name, count)
+            for name, count in self.stats.most_common()
+        )
@@ -1,28 +1,87 @@
 import os
-import copy
+import sys
+import pickle
+import hashlib
 
 from lark import Lark, Transformer, Tree
 from lark.lexer import Token
-
-from . import array_module
+try:
+    from lark.exceptions import VisitError
+except ImportError:
+    # Older versions of Lark let errors raised by a transformer through.
+    class VisitError(Exception):
+        pass
+
+from . import __version__, array_module
+from .compiler import Quotation
+from .effects import check_program, check_word
+from .optimizer import Optimizer
+from .profiler import Profiler
 from .stack import BUILTINS, Stack, WordReturn
-from .wrappers import EmptyNode, ArrayWr, CallWr, CallWr, VarWr, WordWr
+from .wrappers import (EmptyNode, ArrayWr, CallWr, VarWr, WordDef, WordWr,
+                       Words, filter_word_defs)
 
 
 LIB_PATH = '/home/brian/code/bok/lib'
+CACHE_PATH = os.path.expanduser('~/.config/bok/cache')
+GRAMMAR_FILEN = os.path.join(os.path.dirname(__file__), 'grammar.g')
+
+# Bump `COMPILED_FORMAT` whenever the attributes of pickled objects such as
+# `WordWr` change, so that existing `.bokc` files are rebuilt.
+COMPILED_FORMAT = 3
+COMPILED_VERSION = (__version__, COMPILED_FORMAT, sys.version_info[:2],
+                    pickle.HIGHEST_PROTOCOL)
+
+# Parsers built so far, keyed on whether their tables are cached on disk.
+_PARSERS = {}
 
 
-def read_grammar():
-    filen = os.path.join(os.path.dirname(__file__), 'grammar.g')
-    with open(filen, 'r') as f:
-        return Lark(f, start='start', parser='lalr', lexer='contextual')
+def grammar_cache_file(grammar):
+    """
+    Path of the serialized parse tables for a grammar, keyed on a hash of
+    its text so that edits to `grammar.g` never load stale tables.
+    """
+    digest = hashlib.sha256(grammar.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(CACHE_PATH, 'grammar-{0}.lark'.format(digest))
+
+
+def read_grammar(cache=False):
+    with open(GRAMMAR_FILEN, 'r') as f:
+        grammar = f.read()
+    kwargs = {}
+    if cache:
+        try:
+            os.makedirs(CACHE_PATH, exist_ok=True)
+            kwargs['cache'] = grammar_cache_file(grammar)
+        except OSError:
+            pass
+    return Lark(grammar, start='start', parser='lalr', lexer='contextual',
+                **kwargs)
+
+
+def get_parser(cache=False):
+    """
+    Return the process-wide parser, building it on first use. When `cache`
+    is set the LALR tables are loaded from (or saved to) `CACHE_PATH`.
+    """
+    try:
+        return _PARSERS[cache]
+    except KeyError:
+        parser = _PARSERS[cache] = read_grammar(cache=cache)
+        return parser
 
 
 def scope_words(tree, scope=None, words=None):
+    """
+    Rename the word, variable and call tokens of a freshly parsed tree in
+    place to their fully scoped names. `words` is the set of scoped names
+    defined so far, which is added to, so that passing the same set for
+    successive inputs resolves names against earlier definitions.
+    """
     if scope is None:
         scope = []
     if words is None:
-        words = []
+        words = set()
     for subtree in tree.children:
         if not isinstance(subtree, Tree):
             continue
@@ -31,7 +90,7 @@ def scope_words(tree, scope=None, words=None):
         elif subtree.data == 'var':
             name = subtree.children[0].value
             scoped_name = '.'.join([*scope, name]) if scope else name
-            words.append(scoped_name)
+            words.add(scoped_name)
             subtree.children[0].value = scoped_name
         elif subtree.data in ('call', 'dot'):
             name = subtree.children[0].value
@@ -46,16 +105,20 @@ def scope_words(tree, scope=None, words=None):
             name = subtree.children[0].value
             scoped_name = '.'.join([*scope, name]) if scope else name
             scope.append(name)
-            words.append(scoped_name)
+            words.add(scoped_name)
             subtree.children[0].value = scoped_name
             scope_words(subtree, scope, words=words)
             scope.pop()
 
 
 class ReduceTree(Transformer):
-    def __init__(self, words, *args, **kwargs):
+    def __init__(self, words, *args, optimizer=None, modules=None,
+                 parser_cache=False, **kwargs):
         super().__init__(*args, **kwargs)
         self.words = words
+        self.optimizer = optimizer
+        self.modules = Modules() if modules is None else modules
+        self.parser_cache = parser_cache
 
     def number(self, tree):
         return eval(tree[0])
@@ -76,7 +139,9 @@ class ReduceTree(Transformer):
         return None
 
     def list(self, tree):
-        return list(tree)
+        quote = Quotation(tree)
+        quote.optimizer = self.optimizer
+        return quote
 
     def tuple(self, tree):
         return tuple(tree[0])
@@ -100,7 +165,7 @@ class ReduceTree(Transformer):
             return obj
 
     def dot(self, tree):
-        name = '.'.join(tree)
+        name = '.'.join(token.value for token in tree)
         return self.words[name]
 
     def call(self, tree):
@@ -128,10 +193,12 @@ class ReduceTree(Transformer):
         except (AssertionError, AttributeError, IndexError):
             doc = None
             ops = tree[1:]
-        self.words[name] = WordWr(name, ops, doc)
-        return EmptyNode
+        word = WordWr(name, ops, doc, optimizer=self.optimizer)
+        check_word(word)
+        self.words[name] = word
+        return WordDef
 
-    def import_(self, tree):
+    def _import(self, tree, reload=False):
         filen = self.string(tree)
         mod_name = os.path.splitext(os.path.basename(filen))[0]
         if not filen.endswith('.bok'):
@@ -140,10 +207,9 @@ class ReduceTree(Transformer):
             path = filen
         else:
             path = os.path.join(LIB_PATH, filen)
-        with open(path, 'r') as f:
-            text = f.read()
-        words = BUILTINS.copy()
-        _ = parse_text(text, words)
+        words = self.modules.get(path, optimizer=self.optimizer, reload=reload,
+                                 parser_cache=self.parser_cache)
+        self.words.imports.extend(words.imports)
         uniq_names = set(words) - set(BUILTINS.copy())
         new_words = {
             mod_name+'.'+k: words[k] for k in uniq_names
@@ -151,32 +217,219 @@ class ReduceTree(Transformer):
         self.words.update(new_words)
         return EmptyNode
 
+    def import_(self, tree):
+        return self._import(tree)
+
+    def reload(self, tree):
+        return self._import(tree, reload=True)
+
 
-def parse_text(text, words):
-    parser = read_grammar()
+def parse_text(text, words, optimizer=None, modules=None, names=None,
+               parser_cache=False):
+    parser = get_parser(cache=parser_cache)
     tree = parser.parse(text)
-    scope_words(tree)
-    dctree = copy.deepcopy(tree)
-    code = ReduceTree(words).transform(dctree).children
-    code = [op for op in code if op is not EmptyNode]
+    # Scope against a copy, so that the names of rejected input are not
+    # left behind for later input to resolve to.
+    scoped_names = set() if names is None else set(names)
+    scope_words(tree, words=scoped_names)
+    reducer = ReduceTree(words, optimizer=optimizer, modules=modules,
+                         parser_cache=parser_cache)
+    try:
+        code = reducer.transform(tree).children
+    except VisitError as e:
+        # Raise errors from the reducer, such as a circular import, as
+        # themselves rather than wrapped by Lark.
+        raise e.orig_exc
+    code = filter_word_defs(code)
+    if optimizer is not None:
+        code = optimizer.optimize(code)
+    words.link()
+    if names is not None:
+        names.update(scoped_names)
     return code
 
 
-class Machine:
+def source_entry(path, data):
+    """
+    Dependency record of a source file for the compiled module cache.
+    """
+    mtime = os.stat(path).st_mtime_ns
+    digest = hashlib.sha256(data).hexdigest()
+    return (os.path.abspath(path), mtime, digest)
+
+
+def is_fresh(imports):
+    for path, mtime, digest in imports:
+        try:
+            if os.stat(path).st_mtime_ns == mtime:
+                continue
+            with open(path, 'rb') as f:
+                if hashlib.sha256(f.read()).hexdigest() == digest:
+                    continue
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def compiled_files(path):
+    """
+    Candidate locations of the compiled cache of a module: next to the
+    source, or under `CACHE_PATH` if that directory is not writable.
+    """
+    abspath = os.path.abspath(path)
+    digest = hashlib.sha256(abspath.encode('utf-8')).hexdigest()[:16]
+    base = os.path.splitext(os.path.basename(path))[0]
+    return [
+        os.path.splitext(abspath)[0] + '.bokc',
+        os.path.join(CACHE_PATH, '{0}-{1}.bokc'.format(base, digest)),
+    ]
+
+
+def load_compiled(path, optimize):
+    for filen in compiled_files(path):
+        try:
+            with open(filen, 'rb') as f:
+                header = pickle.load(f)
+                if (header['version'] != COMPILED_VERSION
+                        or header['optimize'] != optimize
+                        or not is_fresh(header['imports'])):
+                    continue
+                words = pickle.load(f)
+        except Exception:
+            continue
+        words.link()
+        return words
+    return None
+
+
+def save_compiled(path, words, optimize):
+    header = {
+        'version': COMPILED_VERSION,
+        'optimize': optimize,
+        'imports': words.imports,
+    }
+    for filen in compiled_files(path):
+        tmp_filen = '{0}.{1}.tmp'.format(filen, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(filen), exist_ok=True)
+            with open(tmp_filen, 'wb') as f:
+                pickle.dump(header, f)
+                pickle.dump(words, f)
+            os.replace(tmp_filen, filen)
+            return filen
+        except OSError:
+            continue
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # The module holds objects that cannot be cached; this will not
+            # succeed at any location.
+            break
+        finally:
+            if os.path.exists(tmp_filen):
+                os.remove(tmp_filen)
+    return None
+
+
+def load_module(path, optimizer=None, modules=None, parser_cache=False):
+    """
+    Return the word table of a module, from its compiled `.bokc` cache when
+    that is fresh and otherwise by parsing the source and caching it.
+    Modules it imports are looked up in the `modules` registry.
+    """
+    optimize = optimizer is not None
+    words = load_compiled(path, optimize)
+    if words is not None:
+        return words
+    with open(path, 'rb') as f:
+        data = f.read()
+    words = Words(BUILTINS)
+    words.imports.append(source_entry(path, data))
+    _ = parse_text(data.decode('utf-8'), words, optimizer=optimizer,
+                   modules=modules, parser_cache=parser_cache)
+    save_compiled(path, words, optimize)
+    return words
+
+
+class Modules:
+    """
+    Registry of imported modules keyed by resolved path, so that a module is
+    built once however many times and from wherever it is imported. A
+    `reload` rebuilds the module itself, but not the modules it imports.
+    """
     def __init__(self):
+        self.tables = {}
+        self.loading = []
+
+    def get(self, path, optimizer=None, reload=False, parser_cache=False):
+        path = os.path.realpath(path)
+        if path in self.loading:
+            cycle = self.loading[self.loading.index(path):] + [path]
+            raise RuntimeError('circular import: {0}'.format(' -> '.join(cycle)))
+        key = (path, optimizer is not None)
+        if reload or key not in self.tables:
+            self.loading.append(path)
+            try:
+                self.tables[key] = load_module(path, optimizer=optimizer,
+                                               modules=self,
+                                               parser_cache=parser_cache)
+            finally:
+                self.loading.pop()
+        return self.tables[key]
+
+    def clear(self):
+        self.tables.clear()
+
+
+# Registry shared by every `Machine` created with `share_modules=True`.
+MODULES = Modules()
+
+
+class Machine:
+    """
+    Bok interpreter state. With `profile` set, each run is traced by a
+    `Profiler` kept in `self.profiler`. With `parser_cache` set, the parse
+    tables are kept on disk under `CACHE_PATH` so that later processes skip
+    building them.
+    """
+    def __init__(self, optimize=True, share_modules=False, profile=False,
+                 parser_cache=False):
         self.stack = Stack()
+        self.words = Words(BUILTINS)
         self.code = Stack()
-        self.words = BUILTINS.copy()
-
-    def parse(self, text):
+        self.optimizer = Optimizer() if optimize else None
+        self.modules = MODULES if share_modules else Modules()
+        self.profiler = Profiler(self.words) if profile else None
+        self.parser_cache = parser_cache
+        # Scoped names defined by earlier input, kept between calls to
+        # `parse` so that each input is only resolved against them.
+        self.names = set()
+
+    def parse(self, text, height=None):
+        """
+        Parse text into the program run by `run`. If the program will be
+        run on a stack of `height` items, it is rejected with a
+        `StackEffectError` when it is certain to underflow.
+        """
         if text.strip():
-            self.code = parse_text(text, self.words)
+            code = parse_text(text, self.words, optimizer=self.optimizer,
+                              modules=self.modules, names=self.names,
+                              parser_cache=self.parser_cache)
+            if height is not None:
+                check_program(code, height)
+            self.code = code
 
     def run(self):
+        if self.profiler is None:
+            self._run()
+        else:
+            with self.profiler:
+                self._run()
+
+    def _run(self):
+        # Top-level code runs once, so it is walked rather than compiled.
+        stack = self.stack
         for op in self.code:
             if callable(op):
-                op(self.stack)
+                op(stack)
             else:
-                self.stack.push(op)
-
-
+                stack.push(op)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Tracing profiler for Bok words.
+
+A `Profiler` installs a `sys.setprofile` hook only for the duration of a
+run, so nothing in the interpreter is instrumented and there is no overhead
+when profiling is off. Python frames are attributed to Bok names by their
+code object: user words by `WordWr.__call__`, fused conditionals by their
+`__call__`, and builtins by their function. Every other frame, eg compiled
+word bodies or quotation calls, is transparent and its time is charged to
+the nearest enclosing Bok word.
+
+For each name the profiler records the number of calls, the inclusive and
+exclusive time and the deepest nesting of Bok calls it was seen at. The
+exclusive time is also accumulated per call path for `write_collapsed`, in
+the "collapsed stack" format read by flamegraph tools.
+"""
+
+import sys
+from time import perf_counter
+from collections import Counter, defaultdict
+
+from .optimizer import SEQUENCES, LITERAL_ONE
+from .wrappers import WordWr, FusedIf, FusedCond
+
+
+# Code objects whose frames take their name from the `self` argument.
+BOUND_CODES = {
+    WordWr.__call__.__code__,
+    FusedIf.__call__.__code__,
+    FusedCond.__call__.__code__,
+}
+
+
+class Stat:
+    __slots__ = ('calls', 'inclusive', 'exclusive', 'depth')
+
+    def __init__(self):
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+        self.depth = 0
+
+
+class Profiler:
+    def __init__(self, words):
+        self.words = words
+        self.stats = defaultdict(Stat)
+        self.stacks = Counter()
+        self.names = {}
+        # Entries of `[frame, name, start, child time]` for active calls.
+        self.active = []
+        self.path = []
+        self.running = Counter()
+        self._previous = None
+
+    def _build_names(self):
+        names = {}
+        funcs = [(name, func) for name, func in self.words.items()]
+        funcs.extend((func.__name__, func)
+                     for *_, func in SEQUENCES + LITERAL_ONE)
+        for name, func in funcs:
+            code = getattr(func, '__code__', None)
+            if code is None or code in BOUND_CODES:
+                continue
+            # Functions made by one factory share a code object, so they
+            # cannot be told apart by it.
+            if names.setdefault(code, name) != name:
+                names[code] = '<{0}>'.format(code.co_name)
+        self.names = names
+
+    def _event(self, frame, event, arg):
+        if event == 'call':
+            code = frame.f_code
+            if code in BOUND_CODES:
+                name = frame.f_locals['self'].__name__
+            else:
+                name = self.names.get(code)
+                if name is None:
+                    return
+            self.active.append([frame, name, perf_counter(), 0.0])
+            self.path.append(name)
+            self.running[name] += 1
+        elif event == 'return':
+            if not self.active or self.active[-1][0] is not frame:
+                return
+            frame, name, start, child = self.active.pop()
+            elapsed = perf_counter() - start
+            stat = self.stats[name]
+            stat.calls += 1
+            stat.exclusive += elapsed - child
+            stat.depth = max(stat.depth, len(self.path))
+            # Recursive calls are only counted once toward inclusive time.
+            self.running[name] -= 1
+            if not self.running[name]:
+                stat.inclusive += elapsed
+            self.stacks[tuple(self.path)] += elapsed - child
+            self.path.pop()
+            if self.active:
+                self.active[-1][3] += elapsed
+
+    def __enter__(self):
+        self._build_names()
+        self._previous = sys.getprofile()
+        sys.setprofile(self._event)
+        return self
+
+    def __exit__(self, *exc):
+        sys.setprofile(self._previous)
+        self.active.clear()
+        self.path.clear()
+        self.running.clear()
+
+    def clear(self):
+        self.stats.clear()
+        self.stacks.clear()
+
+    def report(self, limit=None):
+        """
+        Table of the profiled names sorted by exclusive time, times in ms.
+        """
+        if not self.stats:
+            return 'no calls profiled'
+        rows = sorted(self.stats.items(), key=lambda item: item[1].exclusive,
+                      reverse=True)
+        lines = ['{0:20} {1:>10} {2:>12} {3:>12} {4:>6}'.format(
+                 'word', 'calls', 'incl (ms)', 'excl (ms)', 'depth')]
+        for name, stat in rows[:limit]:
+            lines.append('{0:20} {1:>10} {2:>12.3f} {3:>12.3f} {4:>6}'.format(
+                         name, stat.calls, 1e3 * stat.inclusive,
+                         1e3 * stat.exclusive, stat.depth))
+        return '\n'.join(lines)
+
+    def collapsed(self):
+        """
+        Lines of `name;name;.. weight` with the exclusive time of each call
+        path in microseconds.
+        """
+        return [
+            '{0} {1}'.format(';'.join(path), round(1e6 * elapsed))
+            for path, elapsed in sorted(self.stacks.items())
+        ]
+
+    def write_collapsed(self, filen):
+        with open(filen, 'w') as f:
+            f.write('\n'.join(self.collapsed()) + '\n')
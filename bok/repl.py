@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 import os
+import argparse
+import itertools
 
 from termcolor import colored
 from prompt_toolkit import prompt
@@ -12,7 +14,10 @@ from lark.lexer import UnexpectedInput
 from lark.common import UnexpectedToken
 from pygments.token import Token
 
+from .effects import StackEffectError
+from .formatting import FORMATTER, summarize
 from .parser import Machine
+from .runner import print_profile
 from .stack import RaisedError
 from .styling import BokStyle, BokLexer
 
@@ -24,21 +29,57 @@ except:
     HISTORY = InMemoryHistory()
 
 
-def get_completer(machine):
-    matchables = set(
-        k.split('.')[0]
-        for k in machine.words.keys()
-        if k[0].isalnum()
-    )
-    completer = WordCompleter(matchables)
-    return completer
+TOOLBAR_WIDTH = 73
+
+# Containers printed in the REPL with more items than this are summarized.
+PRINT_MAX_ITEMS = 1000
+
+
+class WordsCompleter(WordCompleter):
+    """
+    Completer over the names in a word table. Names are added as words are
+    defined rather than collected from the whole table on every prompt:
+    the table only grows at its end, so the names past those already seen
+    are the new ones.
+    """
+    def __init__(self, words):
+        super().__init__([])
+        self.table = words
+        self.matchables = set()
+        self.n_seen = 0
+
+    def refresh(self):
+        n_words = len(self.table)
+        if n_words == self.n_seen:
+            return
+        if n_words < self.n_seen:
+            self.matchables.clear()
+            self.n_seen = 0
+        self.matchables.update(
+            k.split('.')[0]
+            for k in itertools.islice(self.table, self.n_seen, None)
+            if k[0].isalnum()
+        )
+        self.words = sorted(self.matchables)
+        self.n_seen = n_words
+
+    def get_completions(self, document, complete_event):
+        self.refresh()
+        return super().get_completions(document, complete_event)
 
 
 def get_toolbar(machine):
-    stack_items = [str(ii) for ii in machine.stack]
-    line = ' | '.join(stack_items).replace('\n','').replace('\t','')
-    if len(line) > 73:
-        line = '... {0}'.format(line[-63:])
+    # Summarize items from the top down, only until the line is full.
+    stack_items = []
+    width = 0
+    for item in itertools.islice(reversed(machine.stack), FORMATTER.depth):
+        text = summarize(item)
+        width += len(text) + len(' | ')
+        if width > TOOLBAR_WIDTH:
+            stack_items.append('...')
+            break
+        stack_items.append(text)
+    line = ' | '.join(reversed(stack_items))
     top_txt = ' [top]' if stack_items else ''
     msg = 'stack: {0}{1}'.format(line, top_txt)
     def get_tokens(cli):
@@ -93,8 +134,7 @@ def get_bindings():
     return key_bindings_manager
 
 
-def bok_prompt(machine):
-    completer = get_completer(machine)
+def bok_prompt(machine, completer):
     toolbar = get_toolbar(machine)
     key_bindings_manager = get_bindings()
     source = prompt(
@@ -115,16 +155,21 @@ def bok_prompt(machine):
     return source
 
 
-def repl():
+def repl(profile=False, parser_cache=False):
     print('Bok 0.1, type "[<word>] help" for help.')
     print('Hit CTRL+D or type "exit" to quit.')
     red_err = colored('Error:', 'red')
-    m = Machine()
+    FORMATTER.max_items = PRINT_MAX_ITEMS
+    m = Machine(profile=profile, parser_cache=parser_cache)
+    completer = WordsCompleter(m.words)
     while True:
         try:
-            source = bok_prompt(m)
-            m.parse(source)
+            source = bok_prompt(m, completer)
+            m.parse(source, height=len(m.stack))
             m.run()
+        except StackEffectError as e:
+            # Raised when parsing, before the stack has been touched.
+            print(red_err, e)
         except (RaisedError, RuntimeError, KeyError, IndexError) as e:
             print(red_err, e)
             print(colored('Stack dumped', 'red'))
@@ -147,9 +192,25 @@ def repl():
                 continue
             else:
                 break
+    return m
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog='bok repl', description='Bok REPL')
+    arg_parser.add_argument('--parser-cache', action='store_true',
+                            help='keep the parse tables on disk between runs')
+    arg_parser.add_argument('--profile', action='store_true',
+                            help='print a profile of the session on exit')
+    arg_parser.add_argument('--profile-stacks', metavar='FILE',
+                            help='also write collapsed stacks for flamegraphs')
+    args = arg_parser.parse_args(argv)
+    profile = args.profile or args.profile_stacks is not None
+    m = repl(profile=profile, parser_cache=args.parser_cache)
+    if profile:
+        print_profile(m, args.profile_stacks)
 
 
 if __name__ == '__main__':
-    repl()
+    main()
 
 
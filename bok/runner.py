@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Command line entry point. `bok run` executes script files and optionally
+streams stdin through Bok code without starting the REPL, so that neither
+prompt_toolkit, pygments nor termcolor is imported.
+"""
+
+import sys
+import argparse
+
+from .parser import Machine
+
+
+def run_files(machine, filens):
+    """
+    Parse and execute each file in turn on the same machine, so words
+    defined by one file are visible to the next.
+    """
+    for filen in filens:
+        with open(filen, 'r') as f:
+            machine.parse(f.read(), height=len(machine.stack))
+        machine.run()
+
+
+def run_stream(machine, source, lines):
+    """
+    Parse `source` once, then push each line of `lines`, without its
+    newline, and execute it.
+    """
+    machine.parse(source, height=len(machine.stack) + 1)
+    for line in lines:
+        machine.stack.push(line.rstrip('\n'))
+        machine.run()
+
+
+def print_profile(machine, stacks_filen=None):
+    print(machine.profiler.report(), file=sys.stderr)
+    if stacks_filen is not None:
+        machine.profiler.write_collapsed(stacks_filen)
+
+
+def run(args):
+    profile = args.profile or args.profile_stacks is not None
+    m = Machine(optimize=not args.no_optimize, profile=profile,
+                parser_cache=args.parser_cache)
+    try:
+        run_files(m, args.files)
+        if args.execute is not None:
+            run_stream(m, args.execute, sys.stdin)
+    except SystemExit:
+        pass
+    except Exception as e:
+        print('Error: {0}: {1}'.format(type(e).__name__, e), file=sys.stderr)
+        return 1
+    finally:
+        if profile:
+            print_profile(m, args.profile_stacks)
+    return 0
+
+
+def get_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog='bok',
+                                         description='Bok programming language')
+    subparsers = arg_parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run', help='run script files')
+    run_parser.add_argument('files', nargs='*', metavar='FILE',
+                            help='files to execute in order')
+    run_parser.add_argument('-e', '--execute', metavar='SOURCE',
+                            help='execute SOURCE on each line of stdin')
+    run_parser.add_argument('--no-optimize', action='store_true',
+                            help='disable the peephole optimizer')
+    run_parser.add_argument('--parser-cache', action='store_true',
+                            help='keep the parse tables on disk between runs')
+    run_parser.add_argument('--profile', action='store_true',
+                            help='print a profile to stderr on exit')
+    run_parser.add_argument('--profile-stacks', metavar='FILE',
+                            help='also write collapsed stacks for flamegraphs')
+    subparsers.add_parser('repl', add_help=False,
+                          help='start the interactive REPL (the default)')
+    return arg_parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ('run', '-h', '--help'):
+        from .repl import main as repl_main
+        return repl_main(argv[1:] if argv[:1] == ['repl'] else argv)
+    args = get_arg_parser().parse_args(argv)
+    return run(args)
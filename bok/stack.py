@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 
 import sys
+import pickle
 import textwrap
-from collections import deque, Iterable
+import itertools
+from collections import deque
+from collections.abc import Iterable
 
-from termcolor import colored
+from . import array_module, is_array
+from .compiler import Quotation
+from .formatting import FORMATTER
 
 
 class RaisedError(Exception):
@@ -25,6 +30,7 @@ class Stack(deque):
         self.pylocals = {}
         self.args = []
         self.kwargs = {}
+        self.scratch = None
 
     @property
     def args_loaded(self):
@@ -44,16 +50,37 @@ class Stack(deque):
         return self[:-n].copy()
 
     def call_quote(self, quote):
+        if type(quote) is Quotation:
+            quote.code(self)
+            return
         for op in quote:
             if callable(op):
                 op(self)
             else:
                 self.push(op)
 
+    def get_scratch(self):
+        """
+        Empty stack for evaluating quotations in isolation. It is created on
+        first use and then reused, so that combinators do not allocate a new
+        stack on every iteration. Nested evaluations run on the scratch
+        stack's own scratch stack.
+        """
+        scratch = self.scratch
+        if scratch is None:
+            scratch = self.scratch = Stack()
+        else:
+            scratch.clear()
+            if scratch.args or scratch.kwargs:
+                scratch.clear_args()
+        return scratch
+
     def apply_to_top(self, quote):
-        sub_stack = self.top_to_stack()
-        sub_stack.call_quote(quote)
-        return sub_stack[-1]
+        scratch = self.get_scratch()
+        if self:
+            scratch.append(self[-1])
+        scratch.call_quote(quote)
+        return scratch[-1]
 
 
 #---------------------------------------------------------------------------
@@ -171,7 +198,7 @@ def mod(stack):
 #---------------------------------------------------------------------------
 
 def bit_not(stack):
-    """( i j -- k )"""
+    """( i -- j )"""
     stack[-1] = ~stack[-1]
 
 
@@ -398,6 +425,36 @@ def tuck(stack):
     stack.insert(-2, foo[-1])
 
 
+#---------------------------------------------------------------------------
+#                            Superinstructions
+#---------------------------------------------------------------------------
+# Fused forms of common op sequences, substituted by `bok.optimizer`.
+
+def plus_one(stack):
+    """( x -- x+1 )"""
+    stack[-1] = stack[-1] + 1
+
+
+def minus_one(stack):
+    """( x -- x-1 )"""
+    stack[-1] = stack[-1] - 1
+
+
+def square(stack):
+    """( x -- x*x )"""
+    stack[-1] = stack[-1] * stack[-1]
+
+
+def double(stack):
+    """( x -- x+x )"""
+    stack[-1] = stack[-1] + stack[-1]
+
+
+def over_plus(stack):
+    """( a b -- a b+a )"""
+    stack[-1] = stack[-1] + stack[-2]
+
+
 #---------------------------------------------------------------------------
 #                             Types and Casting
 #---------------------------------------------------------------------------
@@ -426,6 +483,16 @@ def cast_str(stack):
 #                                Printing
 #---------------------------------------------------------------------------
 
+def type_name(value):
+    """
+    Name of the type of a value as users know it, so that quotations, which
+    are lists compiled on demand, are shown as lists.
+    """
+    if isinstance(value, Quotation):
+        return 'list'
+    return type(value).__name__
+
+
 def input_(stack):
     """(  -- s )"""
     stack.push(input())
@@ -433,32 +500,33 @@ def input_(stack):
 
 def print_(stack):
     """( a --  )"""
-    sys.stdout.write(str(stack.pop()))
+    sys.stdout.write(FORMATTER.format_output(stack.pop()))
     sys.stdout.flush()
 
 
 def println(stack):
     """( a --  )"""
-    sys.stdout.write('{0}\n'.format(stack.pop()))
+    sys.stdout.write('{0}\n'.format(FORMATTER.format_output(stack.pop())))
     sys.stdout.flush()
 
 
 def print_stack(stack):
     """(  --  )"""
+    from termcolor import colored
     green = lambda s : colored(s, 'green')
     if not stack:
         print(' # (empty)')
     else:
         print(' # ['+green('type')+']     : ['+green('value')+']')
-        for val in reversed(stack):
-            name = type(val).__name__
-            if name in ('module', 'function'):
-                s = val.__name__
-            else:
-                s = str(val)
+        for val in itertools.islice(reversed(stack), FORMATTER.depth):
+            name = type_name(val)
+            s = FORMATTER.format_item(val)
             if '\n' in s:
                 s = s.replace('\n', '\n'+16*' ')
             print(' - {0:10} : {1}'.format(name, s))
+        n_hidden = len(stack) - FORMATTER.depth
+        if n_hidden > 0:
+            print(' - {0:10} : {1} more items'.format('...', n_hidden))
 
 
 #---------------------------------------------------------------------------
@@ -565,33 +633,197 @@ def dump(stack):
 #                 Higher-order Functions and Combinators
 #---------------------------------------------------------------------------
 
+def is_vectorizable(quote, seen=None):
+    """
+    Whether a quotation is made only of numeric literals, elementwise
+    builtins, NumPy ufuncs and words built from these, so that applying it
+    to a whole array gives the same result as applying it to each element.
+    """
+    if seen is None:
+        seen = set()
+    for op in quote:
+        if type(op) in (int, float, complex, bool):
+            continue
+        if not callable(op):
+            return False
+        if op in VECTOR_OPS:
+            continue
+        target = getattr(op, 'target', op)
+        if isinstance(getattr(target, 'obj', None), array_module.ufunc):
+            continue
+        ops = getattr(target, 'code_ops', None)
+        if ops is None or target.vars or id(target) in seen:
+            return False
+        seen.add(id(target))
+        if not is_vectorizable(ops, seen):
+            return False
+    return True
+
+
+def apply_vectorized(quote, array):
+    """
+    Apply a quotation once to a whole array, returning None if it does not
+    map the array to a single array of the same length.
+    """
+    if array.ndim == 0 or not is_vectorizable(quote):
+        return None
+    sub_stack = Stack([array])
+    try:
+        sub_stack.call_quote(quote)
+    except (IndexError, TypeError, ValueError):
+        return None
+    if len(sub_stack) != 1:
+        return None
+    result = sub_stack[0]
+    if not isinstance(result, array_module.ndarray) or len(result) != len(array):
+        return None
+    return result
+
+
 def map_(stack):
-    """( [a ..] -- [f(a) ..] )"""
+    """( [a ..] [f] -- [f(a) ..] )"""
     quote = stack.pop()
     iterable  = stack[-1]
-    res_stack = Stack()
-    for ii, value in enumerate(iterable):
-        sub_stack = Stack([value])
+    if is_array(iterable):
+        result = apply_vectorized(quote, iterable)
+        if result is not None:
+            stack[-1] = list(result)
+            return
+    results = []
+    sub_stack = stack.get_scratch()
+    for value in iterable:
+        sub_stack.append(value)
         sub_stack.call_quote(quote)
-        res_stack.push(sub_stack.pop())
-    stack[-1] = list(res_stack)
+        results.append(sub_stack.pop())
+        sub_stack.clear()
+    stack[-1] = results
 
 
 def filter_(stack):
     quote = stack.pop()
     iterable  = stack.pop()
-    res_stack = Stack()
-    sub_stack = Stack()
+    if is_array(iterable) and iterable.ndim == 1:
+        mask = apply_vectorized(quote, iterable)
+        if mask is not None and mask.dtype == bool:
+            stack.push(list(iterable[mask]))
+            return
+    results = []
+    sub_stack = stack.get_scratch()
     for value in iterable:
-        sub_stack.push(value)
+        sub_stack.append(value)
         sub_stack.call_quote(quote)
         if sub_stack.pop():
-            res_stack.push(value)
+            results.append(value)
+        sub_stack.clear()
+    stack.push(results)
+
+
+# What pickling raises for objects it cannot handle: generators, for
+# instance, raise `TypeError` and local functions `AttributeError`.
+PICKLE_ERRORS = (pickle.PicklingError, TypeError, AttributeError)
+
+# Process pools used by `pmap`, by number of workers. Pools are started on
+# first use and kept for the life of the process.
+_POOLS = {}
+
+
+def get_pool(n_workers):
+    from concurrent.futures import ProcessPoolExecutor
+    pool = _POOLS.get(n_workers)
+    if pool is None:
+        pool = _POOLS[n_workers] = ProcessPoolExecutor(n_workers)
+    return pool
+
+
+def map_chunk(payload, chunk):
+    """
+    Apply a packed quotation to each of a pickled list of values, in a
+    worker, returning the pickled results, or None if they cannot be pickled.
+    """
+    from .wrappers import unpack_quote
+    quote = unpack_quote(payload)
+    results = []
+    sub_stack = Stack()
+    for value in pickle.loads(chunk):
+        sub_stack.append(value)
+        sub_stack.call_quote(quote)
+        results.append(sub_stack.pop())
         sub_stack.clear()
-    stack.push(list(res_stack))
+    # Pickled here rather than by the pool, so that a result that cannot be
+    # sent back makes the caller fall back to `map` instead of failing.
+    try:
+        return pickle.dumps(results)
+    except PICKLE_ERRORS:
+        return None
+
+
+def parallel_map(quote, values, n_workers=None):
+    """
+    Map a quotation over a list of values in a process pool, returning the
+    results in order, or None if the quotation, values or results cannot be
+    sent between processes.
+    """
+    import os
+    from functools import partial
+    from .wrappers import pack_quote
+    if n_workers is None:
+        if hasattr(os, 'sched_getaffinity'):
+            n_workers = len(os.sched_getaffinity(0))
+        else:
+            n_workers = os.cpu_count() or 1
+    if n_workers < 2 or len(values) < 2:
+        return None
+    n_chunks = min(len(values), 4 * n_workers)
+    size = -(-len(values) // n_chunks)
+    try:
+        payload = pack_quote(quote)
+        chunks = [pickle.dumps(values[ii:ii+size])
+                  for ii in range(0, len(values), size)]
+    except PICKLE_ERRORS:
+        return None
+    pool = get_pool(n_workers)
+    mapped = list(pool.map(partial(map_chunk, payload), chunks))
+    if any(chunk is None for chunk in mapped):
+        return None
+    return [result for chunk in mapped for result in pickle.loads(chunk)]
+
+
+def pmap(stack):
+    """
+    ( [a ..] [f] -- [f(a) ..] )
+
+    As `map`, but in a pool of worker processes, one per usable CPU. The
+    quotation and the words it can reach are sent to the workers, so it
+    should not depend on or change anything else. Falls back to `map` if they,
+    the values or the results cannot be pickled.
+    """
+    _pmap(stack, None)
+
+
+def pmapn(stack):
+    """( [a ..] [f] n -- [f(a) ..] )"""
+    n_workers = stack.pop()
+    _pmap(stack, n_workers)
+
+
+def _pmap(stack, n_workers):
+    quote = stack[-1]
+    values = stack[-2]
+    if not is_array(values):
+        values = stack[-2] = list(values)
+    results = parallel_map(quote, values, n_workers)
+    if results is None:
+        map_(stack)
+    else:
+        stack.pop()
+        stack[-1] = results
 
 
 def fold(stack):
+    """
+    ( [a b] init [f] -- f(f(init, a), b) )
+    ( [..] init [f] -- .. )
+    """
     quote = stack.pop()
     initial = stack.pop()
     iterable = stack.pop()
@@ -678,6 +910,7 @@ def while_(stack):
 
 
 def foreach(stack):
+    """( [a ..] [f] -- f(a) .. )"""
     quote = stack.pop()
     iterable = stack.pop()
     for value in iterable:
@@ -761,7 +994,7 @@ def help_(stack):
     if not quote:
         raise RuntimeError('help passed an empty list')
     obj = quote[0]
-    docstring = obj.__doc__
+    docstring = list.__doc__ if isinstance(obj, Quotation) else obj.__doc__
     if docstring is None and hasattr(obj, '__name__'):
         print('"{0}" has no docstring available'.format(obj.__name__))
     elif docstring is None:
@@ -793,6 +1026,297 @@ def exit(stack):
     sys.exit(0)
 
 
+#---------------------------------------------------------------------------
+#                              Memoization
+#---------------------------------------------------------------------------
+
+def quoted_word(stack):
+    """
+    Pop a quotation holding a single user word and return the word.
+    """
+    from .wrappers import WordWr
+    quote = stack.pop()
+    if not isinstance(quote, list) or len(quote) != 1:
+        raise RuntimeError('expected a quotation of one word')
+    word = quote[0]
+    if getattr(word, 'late_bound', False):
+        word = word.words[word.name]
+    if not isinstance(word, WordWr):
+        raise RuntimeError('"{0}" is not a user word'.format(
+                           getattr(word, '__name__', word)))
+    return word
+
+
+def memoized(stack):
+    word = quoted_word(stack)
+    if word.memo is None:
+        raise RuntimeError('"{0}" is not memoized'.format(word.__name__))
+    return word.memo
+
+
+def memo(stack):
+    """
+    ( [word] n -- )
+    ( [word] [n size] -- )
+
+    Cache the results of a pure word keyed on its top `n` arguments,
+    keeping at most `size` (default 1024) of them.
+    """
+    from .wrappers import Memo
+    value = stack.pop()
+    n_args, *size = value if isinstance(value, Iterable) else [value]
+    word = quoted_word(stack)
+    word.memo = Memo(word, n_args, *size)
+
+
+def memo_stats(stack):
+    """( [word] -- stats )"""
+    stack.push(memoized(stack).stats())
+
+
+def memo_clear(stack):
+    """( [word] -- )"""
+    memoized(stack).clear()
+
+
+#---------------------------------------------------------------------------
+#                                Streams
+#---------------------------------------------------------------------------
+# Lazy counterparts of the list combinators. Each takes any iterable and
+# leaves an iterator, written `<a ..>`, that does its work only as items are pulled from it, eg
+# by `foreach`, `fold` or `collect`, so a pipeline holds one item at a time.
+# Quotations are evaluated on a stack owned by each iterator.
+
+def _lmap(quote, iterable):
+    sub_stack = Stack()
+    for value in iterable:
+        sub_stack.append(value)
+        sub_stack.call_quote(quote)
+        yield sub_stack.pop()
+        sub_stack.clear()
+
+
+def _lfilter(quote, iterable):
+    sub_stack = Stack()
+    for value in iterable:
+        sub_stack.append(value)
+        sub_stack.call_quote(quote)
+        keep = sub_stack.pop()
+        sub_stack.clear()
+        if keep:
+            yield value
+
+
+def _chunk(n, iterable):
+    it = iter(iterable)
+    while True:
+        items = list(itertools.islice(it, n))
+        if not items:
+            return
+        yield items
+
+
+def _lfold(quote, initial, iterable):
+    sub_stack = Stack([initial])
+    for value in iterable:
+        sub_stack.append(value)
+        sub_stack.call_quote(quote)
+        yield sub_stack[-1]
+
+
+def lmap(stack):
+    """( [a ..] [f] -- <f(a) ..> )"""
+    quote = stack.pop()
+    stack[-1] = _lmap(quote, stack[-1])
+
+
+def lfilter(stack):
+    """( [a ..] [f] -- <a if f(a) ..> )"""
+    quote = stack.pop()
+    stack[-1] = _lfilter(quote, stack[-1])
+
+
+def take(stack):
+    """( [a ..] n -- <a .. a_n> )"""
+    n = stack.pop()
+    stack[-1] = itertools.islice(stack[-1], n)
+
+
+def chunk(stack):
+    """( [a ..] n -- <[a .. a_n] ..> )"""
+    n = stack.pop()
+    if n < 1:
+        raise RuntimeError('chunk size must be positive')
+    stack[-1] = _chunk(n, stack[-1])
+
+
+def lfold(stack):
+    """
+    ( [a b ..] init [f] -- <f(init, a) f(f(init, a), b) ..> )
+
+    Running results of `fold`, ie its partial accumulations.
+    """
+    quote = stack.pop()
+    initial = stack.pop()
+    stack[-1] = _lfold(quote, initial, stack[-1])
+
+
+def collect(stack):
+    """( <a ..> -- [a ..] )"""
+    stack[-1] = list(stack[-1])
+
+
+#---------------------------------------------------------------------------
+#                          Memory-mapped Arrays
+#---------------------------------------------------------------------------
+# Arrays backed by a file, of which only the pages touched are read into
+# memory. Modes are those of `numpy.memmap`: "r" read-only, "c" copy-on-write
+# (changes are kept in memory only) and "r+" read-write. `get` with an index
+# or a `slice` leaves a view of the file rather than a copy.
+
+MMAP_MODES = ('r', 'c', 'r+')
+
+# Bytes copied at a time by `mmapsave`.
+MMAP_BLOCK = 1 << 26
+
+
+def check_mode(mode):
+    if mode not in MMAP_MODES:
+        raise RuntimeError('memory map mode must be one of {0}'.format(
+                           ', '.join(MMAP_MODES)))
+
+
+def mmap(stack):
+    """
+    ( path mode -- array )
+
+    Map the array in a `.npy` file.
+    """
+    mode = stack.pop()
+    check_mode(mode)
+    stack[-1] = array_module.load(stack[-1], mmap_mode=mode)
+
+
+def mmap_raw(stack):
+    """
+    ( path dtype mode -- array )
+
+    Map a headerless binary file as a flat array of `dtype`.
+    """
+    mode = stack.pop()
+    dtype = stack.pop()
+    check_mode(mode)
+    stack[-1] = array_module.memmap(stack[-1], dtype=dtype, mode=mode)
+
+
+def mmap_new(stack):
+    """
+    ( path dtype shape -- array )
+
+    Create a `.npy` file of zeros and map it read-write.
+    """
+    shape = stack.pop()
+    dtype = stack.pop()
+    stack[-1] = array_module.lib.format.open_memmap(
+            stack[-1], mode='w+', dtype=dtype,
+            shape=tuple(shape) if isinstance(shape, Iterable) else (shape,))
+
+
+def mmap_save(stack):
+    """
+    ( array path -- )
+
+    Write an array to a `.npy` file through a memory map, copying a block
+    of rows at a time so that a mapped source is never read in whole.
+    """
+    path = stack.pop()
+    array = array_module.asanyarray(stack.pop())
+    out = array_module.lib.format.open_memmap(
+            path, mode='w+', dtype=array.dtype, shape=array.shape)
+    if array.ndim == 0:
+        out[()] = array
+    else:
+        row_bytes = max(array[:1].nbytes, 1)
+        step = max(MMAP_BLOCK // row_bytes, 1)
+        for start in range(0, len(array), step):
+            out[start:start+step] = array[start:start+step]
+    out.flush()
+    del out
+
+
+def mmap_flush(stack):
+    """
+    ( array -- array )
+
+    Write changes to a read-write memory mapped array back to its file.
+    """
+    array = stack[-1]
+    if not isinstance(array, array_module.memmap):
+        raise RuntimeError('mmapflush must take a memory mapped array')
+    array.flush()
+
+
+# Builtins that act elementwise on arrays, and so may be applied to a
+# whole array at once by `map` and `filter`. Those that update the top in
+# place, like `++`, would modify the input array and are left out.
+VECTOR_OPS = {
+    negate, plus, minus, mul, power, div, floor_div, mod,
+    bit_not, bit_and, bit_or, bit_xor, bit_lshift, bit_rshift,
+    eq, ne, gt, ge, lt, le, abs_,
+    drop, drop2, dup, swap, over, rollup, rolldown, rotate, nip, nop,
+    plus_one, minus_one, square, double, over_plus,
+}
+
+
+# Builtins that `bok.compiler` inlines into compiled code, as the number of
+# items each takes and Python expressions of those, `{0}` being the deepest,
+# for the items it leaves. Each must do no more than evaluate these
+# expressions, so that inlining it changes nothing but speed. Those that
+# update the top in place, like `++`, are left out.
+INLINE_OPS = {
+    negate:     (1, ['(-{0})']),
+    plus:       (2, ['({0} + {1})']),
+    minus:      (2, ['({0} - {1})']),
+    mul:        (2, ['({0} * {1})']),
+    power:      (2, ['({0} ** {1})']),
+    div:        (2, ['({0} / {1})']),
+    floor_div:  (2, ['({0} // {1})']),
+    mod:        (2, ['({0} % {1})']),
+    bit_not:    (1, ['(~{0})']),
+    bit_and:    (2, ['({0} & {1})']),
+    bit_or:     (2, ['({0} | {1})']),
+    bit_xor:    (2, ['({0} ^ {1})']),
+    bit_lshift: (2, ['({0} << {1})']),
+    bit_rshift: (2, ['({0} >> {1})']),
+    eq:         (2, ['({0} == {1})']),
+    ne:         (2, ['({0} != {1})']),
+    gt:         (2, ['({0} > {1})']),
+    ge:         (2, ['({0} >= {1})']),
+    lt:         (2, ['({0} < {1})']),
+    le:         (2, ['({0} <= {1})']),
+    not_:       (1, ['(not {0})']),
+    and_:       (2, ['({0} and {1})']),
+    or_:        (2, ['({0} or {1})']),
+    xor:        (2, ['((not {0} and {1}) or (not {1} and {0}))']),
+    abs_:       (1, ['abs({0})']),
+    nop:        (0, []),
+    drop:       (1, []),
+    drop2:      (2, []),
+    dup:        (1, ['{0}', '{0}']),
+    swap:       (2, ['{1}', '{0}']),
+    over:       (2, ['{0}', '{1}', '{0}']),
+    rollup:     (3, ['{2}', '{0}', '{1}']),
+    rolldown:   (3, ['{1}', '{2}', '{0}']),
+    rotate:     (3, ['{2}', '{1}', '{0}']),
+    nip:        (2, ['{1}']),
+    plus_one:   (1, ['({0} + 1)']),
+    minus_one:  (1, ['({0} - 1)']),
+    square:     (1, ['({0} * {0})']),
+    double:     (1, ['({0} + {0})']),
+    over_plus:  (2, ['{0}', '({1} + {0})']),
+}
+
+
 BUILTINS = {
     '!=':       ne,
     '%':        mod,
@@ -828,7 +1352,9 @@ BUILTINS = {
     'bool':     cast_bool,
     'choice':   choice,
     'chr':      chr_,
+    'chunk':    chunk,
     'cleave':   cleave,
+    'collect':  collect,
     'cond':     cond,
     'dip':      dip,
     'drop':     drop,
@@ -851,20 +1377,33 @@ BUILTINS = {
     'int':      cast_int,
     'keep':     keep,
     'len':      len_,
+    'lfilter':  lfilter,
+    'lfold':    lfold,
     'linrec':   linrec,
     'list':     list_,
     'list2':    list2,
     'list3':    list3,
     'listn':    listn,
+    'lmap':     lmap,
     'map':      map_,
     'max':      max_,
+    'memo':     memo,
+    'memoclear': memo_clear,
+    'memostats': memo_stats,
     'min':      min_,
+    'mmap':     mmap,
+    'mmapflush': mmap_flush,
+    'mmapnew':  mmap_new,
+    'mmapraw':  mmap_raw,
+    'mmapsave': mmap_save,
     'negate':   negate,
     'nip':      nip,
     'nop':      nop,
     'not':      not_,
     'or':       or_,
     'over':     over,
+    'pmap':     pmap,
+    'pmapn':    pmapn,
     'prepend':  prepend,
     'print':    print_,
     'println':  println,
@@ -884,6 +1423,7 @@ BUILTINS = {
     'str':      cast_str,
     'sum':      sum_,
     'swap':     swap,
+    'take':     take,
     'tri':      tri,
     'tuck':     tuck,
     'tuple':    tuple_,
@@ -100,7 +100,7 @@ class BokLexer(RegexLexer):
                 'nop', 'not', 'and', 'or', 'bool', 'int', 'float', 'str',
                 'read', 'print', 'println', 'stack', 'list', 'listn', 'eval',
                 'error', 'assert', 'dump', 'pyeval', 'pyexec', 'pylocals',
-                'import', 'exit', 'help'), suffix=r'\b'),
+                'import', 'reload', 'exit', 'help'), suffix=r'\b'),
              Keyword),
         ],
         'numbers': [
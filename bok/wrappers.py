@@ -1,18 +1,31 @@
 #!/usr/bin/env python3
 
-from collections import Iterable
+import io
+import pickle
+import weakref
+from collections import OrderedDict
+from collections.abc import Iterable
 
 from . import array_module
+from .compiler import Quotation, compile_ops
+from .stack import WordReturn, cond, if_, unless, when
 
 
 class EmptyNode:
     pass
 
 
+class WordDef:
+    """
+    Left by the reducer in the place of a nested word definition.
+    """
+    pass
+
+
 def filter_word_defs(ops):
     return [
         op for op in ops
-        if op is not EmptyNode
+        if op is not EmptyNode and op is not WordDef
     ]
 
 
@@ -49,68 +62,518 @@ class ArrayWr(PyWr):
     repr_fmt = '<@{0}>'
 
 
+class Words(dict):
+    """
+    Word table. Defining, redefining or deleting a name records it in
+    `changed`, and `link` resolves the late-bound `CallWr` nodes registered
+    against the table for those names only. Calls are indexed by name in
+    `calls` and held weakly, so calls from discarded code are dropped.
+    `imports` lists the `(path, mtime, digest)` of every source file the
+    table was built from.
+    """
+    def __new__(cls, *args, **kwargs):
+        # Set up in `__new__` so that the attributes exist while a pickled
+        # table is being filled, before its state is restored.
+        self = super().__new__(cls, *args, **kwargs)
+        self.changed = set()
+        self.calls = {}
+        self.n_names = 0
+        self.imports = []
+        return self
+
+    def __getstate__(self):
+        return {'imports': self.imports}
+
+    def __setitem__(self, name, value):
+        self.changed.add(name)
+        super().__setitem__(name, value)
+
+    def __delitem__(self, name):
+        self.changed.add(name)
+        super().__delitem__(name)
+
+    def update(self, *args, **kwargs):
+        for name, value in dict(*args, **kwargs).items():
+            self[name] = value
+
+    def register(self, call):
+        calls = self.calls.get(call.name)
+        if calls is None:
+            if len(self.calls) > 2 * self.n_names:
+                self._prune()
+            calls = self.calls[call.name] = weakref.WeakSet()
+        calls.add(call)
+        if call.name in self:
+            self.changed.add(call.name)
+
+    def _prune(self):
+        """
+        Drop the names whose calls have all been collected. Done when the
+        index has doubled in size, so the cost is constant per call.
+        """
+        self.calls = {name: calls for name, calls in self.calls.items() if calls}
+        self.n_names = len(self.calls)
+
+    def link(self):
+        """
+        Point the calls to every name defined, redefined or deleted since
+        the last link at their target. Calls to other names are left alone,
+        so the cost depends only on what changed.
+        """
+        changed = self.changed
+        self.changed = set()
+        for name in changed:
+            calls = self.calls.get(name)
+            if calls is None:
+                continue
+            if not calls:
+                del self.calls[name]
+                continue
+            for call in calls:
+                call.link()
+
+
 class CallWr(ReprWrapper):
+    """
+    Call to a word that was not yet defined when the call was parsed. Once
+    linked, `target` is the word itself; until then it looks the name up on
+    every call. Compiled code calls `target` directly.
+    """
+    late_bound = True
+
     def __init__(self, name, words):
         self.name = name
         self.__name__ = name
         self.words = words
+        self.target = self.lookup
+        if isinstance(words, Words):
+            words.register(self)
 
-    def __call__(self, stack):
+    def lookup(self, stack):
         return self.words[self.name](stack)
 
+    def _prune(self):
+        """
+        Drop the names whose calls have all been collected. Done when the
+        index has doubled in size, so the cost is constant per call.
+        """
+        self.calls = {name: calls for name, calls in self.calls.items() if calls}
+        self.n_names = len(self.calls)
+
+    def link(self):
+        try:
+            self.target = self.words[self.name]
+        except KeyError:
+            self.target = self.lookup
+            return False
+        return True
+
+    def __call__(self, stack):
+        return self.target(stack)
+
+    def __getstate__(self):
+        return {'name': self.name, 'words': self.words}
+
+    def __setstate__(self, state):
+        self.__init__(state['name'], state['words'])
+
     @property
     def __doc__(self):
         return self.words[self.name].__doc__
 
 
 class VarWr(ReprWrapper):
+    """
+    Variable bound with `:name`. A variable bound inside a word lives in
+    slot `slot` of that word's current frame, so every invocation, including
+    recursive ones, has its own value, which is released when the
+    invocation returns. Variables bound at the top level or by a namespace
+    are held in `val`.
+    """
     repr_fmt = '<:{0}>'
 
     def __init__(self, name):
         self.__name__ = name
         self.val = None
+        self.frames = None
+        self.slot = None
 
     def new(self, stack):
-        self.val = stack.pop()
+        frames = self.frames
+        if frames:
+            frames[-1][self.slot] = stack.pop()
+        else:
+            self.val = stack.pop()
+
+    def __call__(self, stack):
+        frames = self.frames
+        if frames:
+            stack.push(frames[-1][self.slot])
+        else:
+            stack.push(self.val)
+
+
+class FusedIf(ReprWrapper):
+    """
+    `if`, `when` or `unless` applied to literal quotations. The clauses are
+    held directly rather than pushed and popped from the stack.
+    """
+    repr_fmt = '<fused:{0}>'
+
+    def __init__(self, name, cond_q, true_q=None, false_q=None):
+        self.__name__ = name
+        self.cond_q = cond_q
+        self.true_q = true_q
+        self.false_q = false_q
+
+    def map_clauses(self, func):
+        """
+        Copy with `func` applied to the branch clauses, or self if that
+        changed none of them.
+        """
+        true_q, false_q = [
+            None if quote is None else func(quote)
+            for quote in (self.true_q, self.false_q)
+        ]
+        if true_q is self.true_q and false_q is self.false_q:
+            return self
+        return FusedIf(self.__name__, self.cond_q, true_q, false_q)
+
+    def __call__(self, stack):
+        if stack.apply_to_top(self.cond_q):
+            if self.true_q is not None:
+                stack.call_quote(self.true_q)
+        elif self.false_q is not None:
+            stack.call_quote(self.false_q)
 
-    def clear(self):
-        self.val = None
+
+class FusedCond(ReprWrapper):
+    """
+    `cond` applied to a literal list of `[pred expr]` pairs.
+    """
+    repr_fmt = '<fused:{0}>'
+
+    def __init__(self, pairs):
+        self.__name__ = 'cond'
+        self.pairs = pairs
+
+    def map_clauses(self, func):
+        exprs = [func(expr) for _, expr in self.pairs]
+        if all(new is old for new, (_, old) in zip(exprs, self.pairs)):
+            return self
+        return FusedCond([(pred, expr) for (pred, _), expr in zip(self.pairs, exprs)])
 
     def __call__(self, stack):
-        stack.push(self.val)
+        for pred, expr in self.pairs:
+            if stack.apply_to_top(pred):
+                stack.call_quote(expr)
+                break
+
+
+def is_quote(op):
+    return type(op) is Quotation
+
+
+def fuse_conditional(ops):
+    """
+    If `ops` ends with `if`, `when`, `unless` or `cond` applied to literal
+    quotations, return the number of trailing ops this spans and the fused
+    op to replace them with, otherwise None.
+    """
+    last = ops[-1] if ops else None
+    if last is if_ and len(ops) >= 4:
+        if all(is_quote(op) for op in ops[-4:-1]):
+            return 4, FusedIf('if', *ops[-4:-1])
+    elif (last is when or last is unless) and len(ops) >= 3:
+        if is_quote(ops[-3]) and is_quote(ops[-2]):
+            if last is when:
+                return 3, FusedIf('when', ops[-3], true_q=ops[-2])
+            return 3, FusedIf('unless', ops[-3], false_q=ops[-2])
+    elif last is cond and len(ops) >= 2 and is_quote(ops[-2]):
+        pairs = ops[-2]
+        if all(is_quote(pair) and len(pair) == 2 and all(map(is_quote, pair))
+               for pair in pairs):
+            return 2, FusedCond([tuple(pair) for pair in pairs])
+    return None
+
+
+class TailCall(ReprWrapper):
+    """
+    Self-call in tail position of a word. Rather than calling the word again
+    it flags the running invocation to loop, unless the name has since been
+    redefined to a different word.
+    """
+    repr_fmt = '<tail:{0}>'
+
+    def __init__(self, call, word):
+        self.__name__ = call.name
+        self.call = call
+        self.word = word
+
+    def __call__(self, stack):
+        if self.call.target is self.word:
+            self.word.again = True
+        else:
+            self.call.target(stack)
+
+
+def mark_tail_calls(word, ops):
+    """
+    Replace the calls of `word` to itself that are in tail position in
+    `ops`, ie the last op or the last op of a branch of a trailing
+    conditional on literal quotations, with `TailCall` ops. Returns `ops`
+    itself if there are none.
+    """
+    if not ops:
+        return ops
+    last = ops[-1]
+    if getattr(last, 'late_bound', False) and last.name == word.__name__:
+        return [*ops[:-1], TailCall(last, word)]
+    n, op = fuse_conditional(ops) or (1, last)
+    if isinstance(op, (FusedIf, FusedCond)):
+        tail_op = op.map_clauses(lambda quote: tail_quote(word, quote))
+        if tail_op is not op:
+            return [*ops[:-n], tail_op]
+    return ops
+
+
+def tail_quote(word, quote):
+    ops = mark_tail_calls(word, quote)
+    if ops is quote:
+        return quote
+    new_quote = Quotation(ops)
+    new_quote.optimizer = quote.optimizer
+    return new_quote
 
 
 class WordWr(ReprWrapper):
-    def __init__(self, name, ops, doc):
+    def __init__(self, name, ops, doc, optimizer=None):
         self.__doc__ = doc
         self.__name__ = name
         self.ops = filter_word_defs(ops)
-        self.vars = self._get_vars()
+        self.frames = []
+        # A word that defines others is a namespace. The variables it binds
+        # belong to the namespace rather than to one call, so they are left
+        # in `val` for the words it defines to read after it has run.
+        self.is_namespace = any(op is WordDef for op in ops)
+        self.vars = set() if self.is_namespace else self._get_vars()
+        self.n_slots = len(self.vars)
+        for slot, var in enumerate(sorted(self.vars, key=lambda v: v.__name__)):
+            var.frames = self.frames
+            var.slot = slot
+        self.code_ops = self.ops
+        if optimizer is not None:
+            self.code_ops = optimizer.optimize(self.code_ops)
+        tail_ops = mark_tail_calls(self, self.code_ops)
+        self.tail_calls = tail_ops is not self.code_ops
+        self.code_ops = tail_ops
+        self.again = False
+        self.memo = None
+        self.effect = None
+        self.code = compile_ops(self.code_ops, name)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['code']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.code = compile_ops(self.code_ops, self.__name__)
 
     def _get_vars(self):
         """
-        The method `.new` of an instance of VarWrapper is actually the op
-        that's in the list, but we want the instance itself.
+        Variables bound in the body, including within its quotations. The
+        method `.new` of an instance of VarWr is actually the op that's in
+        the list, but we want the instance itself.
         """
-        return set(
-            op.__self__ for op in self.ops
-            if hasattr(op, '__self__') and isinstance(op.__self__, VarWrapper)
-        )
-
-    def _clear_vars(self):
-        for var in self.vars:
-            var.clear()
+        found = set()
+        def scan(ops):
+            for op in ops:
+                if isinstance(op, Quotation):
+                    scan(op)
+                elif isinstance(getattr(op, '__self__', None), VarWr):
+                    found.add(op.__self__)
+        scan(self.ops)
+        return found
+
+    def invoke(self, stack):
+        """
+        Run the body in a new frame, looping for as long as it ends in a
+        tail call. This is the general form of `__call__`, which inlines
+        the common cases.
+        """
+        while True:
+            self.again = False
+            if self.n_slots:
+                self.frames.append([None] * self.n_slots)
+            try:
+                self.code(stack)
+            except WordReturn:
+                pass
+            finally:
+                if self.n_slots:
+                    self.frames.pop()
+            if not self.again:
+                return
 
     def __call__(self, stack):
+        if self.memo is not None:
+            return self.memo(stack)
+        if self.tail_calls:
+            return self.invoke(stack)
+        if not self.n_slots:
+            try:
+                self.code(stack)
+            except WordReturn:
+                pass
+            return
+        self.frames.append([None] * self.n_slots)
         try:
-            for op in self.ops:
-                if callable(op):
-                    op(stack)
-                else:
-                    stack.append(op)
+            self.code(stack)
         except WordReturn:
             pass
-        if self.vars:
-            self._clear_vars()
+        finally:
+            self.frames.pop()
+
+
+
+class Memo:
+    """
+    Result cache of a memoized word, set as its `memo` by the `memo` word.
+    Results are keyed on the top `n_args` items, so the word must be pure:
+    it may only consume those items and what it leaves depends on nothing
+    else. At most `size` results are kept, dropping the least recently
+    used. Calls with unhashable arguments are passed through uncached.
+    """
+    def __init__(self, word, n_args, size=1024):
+        self.word = word
+        self.n_args = n_args
+        self.size = size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
 
+    def clear(self):
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.cache),
+            'maxsize': self.size,
+        }
 
+    def __call__(self, stack):
+        n_args = self.n_args
+        height = len(stack) - n_args
+        if height < 0:
+            raise IndexError('"{0}" takes {1} items'.format(
+                             self.word.__name__, n_args))
+        args = tuple(stack[ii] for ii in range(height, len(stack)))
+        # Typed, as `functools.lru_cache(typed=True)`, so that `1`, `1.0` and
+        # `True` are not answered from each other's entries.
+        key = args + tuple(type(arg) for arg in args)
+        try:
+            results = self.cache.get(key)
+        except TypeError:
+            return self.word.invoke(stack)
+        if results is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            for _ in range(n_args):
+                stack.pop()
+            stack.extend(results)
+            return
+        self.misses += 1
+        self.word.invoke(stack)
+        self.cache[key] = tuple(stack[ii] for ii in range(height, len(stack)))
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+
+    def __getstate__(self):
+        # Results stay with the process that computed them.
+        state = self.__dict__.copy()
+        state.update(cache=OrderedDict(), hits=0, misses=0)
+        return state
+
+
+def reachable_words(quote):
+    """
+    Copies of the word tables that the late-bound calls reachable from
+    `quote` look up, holding only the names those calls use, as a dict of
+    `{id(table): copy}`.
+    """
+    tables = {}
+    seen = set()
+    def scan(ops):
+        for op in ops:
+            if isinstance(op, (int, float, complex, str, bytes)) or id(op) in seen:
+                continue
+            seen.add(id(op))
+            if isinstance(op, (list, tuple)):
+                scan(op)
+            elif isinstance(op, CallWr):
+                table = tables.setdefault(id(op.words), Words())
+                if op.name in op.words and op.name not in table:
+                    table[op.name] = op.words[op.name]
+                    scan([table[op.name]])
+            elif isinstance(op, WordWr):
+                scan(op.code_ops)
+            elif isinstance(op, TailCall):
+                scan([op.call, op.word])
+            elif isinstance(op, FusedIf):
+                scan([op.cond_q, op.true_q or (), op.false_q or ()])
+            elif isinstance(op, FusedCond):
+                scan(op.pairs)
+    scan([quote])
+    return tables
+
+
+class QuotePickler(pickle.Pickler):
+    """
+    Pickler that stores references to word tables by id, so that the
+    tables themselves are left out.
+    """
+    def persistent_id(self, obj):
+        if isinstance(obj, Words):
+            return id(obj)
+        return None
+
+
+class QuoteUnpickler(pickle.Unpickler):
+    def __init__(self, file, tables):
+        super().__init__(file)
+        self.tables = tables
+
+    def persistent_load(self, key):
+        return self.tables.setdefault(key, Words())
+
+
+def pack_quote(quote):
+    """
+    Pickle a quotation together with only the words it can reach, rather
+    than the whole tables its late-bound calls refer to.
+    """
+    tables = reachable_words(quote)
+    f = io.BytesIO()
+    QuotePickler(f).dump(({key: dict(table) for key, table in tables.items()},
+                          quote))
+    return f.getvalue()
+
+
+def unpack_quote(payload):
+    """
+    Restore a quotation pickled by `pack_quote`, with its calls linked.
+    """
+    tables = {}
+    contents, quote = QuoteUnpickler(io.BytesIO(payload), tables).load()
+    for key, items in contents.items():
+        table = tables.setdefault(key, Words())
+        table.update(items)
+    for table in tables.values():
+        table.link()
+    return quote
@@ -37,6 +37,9 @@ setup(
     extras_require={
         'test': ['pytest'],
     },
+    entry_points={
+        'console_scripts': ['bok = bok.runner:main'],
+    },
     package_data={
         'bok': ['grammar.g'],
     },
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Compiled word bodies, in which runs of pure builtins are inlined, must
+leave the same stack as the ops run one at a time, as top-level code is.
+"""
+
+import pytest
+
+from bok.compiler import compile_ops
+from bok.parser import Machine
+from bok.stack import Stack, plus
+
+
+PROGRAMS = [
+    '1 2 + 3 * 4 - 5 / 2 // 7 % 2 **',
+    '1.5 dup * dup + 0.5 -',
+    '7 3 & 1 | 6 ^ 2 << 1 >> ~ negate abs',
+    '1 2 == 1 2 != 1 2 < 1 2 <= 1 2 > 1 2 >=',
+    'True False and True False or True False xor True not',
+    '0 "a" or "" "b" and',
+    '1 2 3 drop swap over rollup rolldown rotate nip',
+    '1 2 3 4 drop2 nop dup',
+    '[1 2] [3] + "ab" 2 * swap',
+    '3 @arange dup 2 * + 1 -',
+    '5 dup 1 + swap 1 - *',
+    '2 3 over + 4 swap',
+]
+
+# Items below the program, so that it also pops what was there before.
+BELOW = [10, 3]
+
+
+def run(text, compiled):
+    machine = Machine(optimize=False)
+    machine.stack.extend(BELOW)
+    if compiled:
+        text = '( w {0} ) w'.format(text)
+    machine.parse(text)
+    machine.run()
+    return [
+        item.tolist() if hasattr(item, 'tolist') else item
+        for item in machine.stack
+    ]
+
+
+@pytest.mark.parametrize('text', PROGRAMS)
+def test_inlined_same_stack(text):
+    assert run(text, compiled=True) == run(text, compiled=False)
+
+
+@pytest.mark.parametrize('text', ['+ +', 'drop drop drop', 'swap swap drop drop drop'])
+def test_inlined_underflow(text):
+    with pytest.raises(IndexError):
+        run(text, compiled=True)
+
+
+def test_inlined_run_is_pushed_before_a_call():
+    called = []
+    def word(stack):
+        called.append(list(stack))
+    ops = [1, 2, plus, word, 3]
+    func = compile_ops(ops)
+    stack = Stack()
+    func(stack)
+    assert list(stack) == [3, 3]
+    assert called == [[3]]
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Memoized words must leave what the word itself would have left.
+"""
+
+from bok.parser import Machine
+
+
+def run(text):
+    machine = Machine()
+    machine.parse(text)
+    machine.run()
+    return list(machine.stack)
+
+
+def test_keys_on_argument_types():
+    stack = run('( h 2 * ) [h] 1 memo 1 h 1.0 h True h')
+    assert stack == [2, 2.0, 2]
+    assert [type(item) for item in stack] == [int, float, int]
+
+
+def test_hits_are_the_word_results():
+    assert run('( h 2 * ) [h] 1 memo 3 h 3 h 4 h') == [6, 6, 8]
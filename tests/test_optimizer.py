@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+The peephole optimizer must not change what a program computes: each
+program is run with and without it and the final stacks compared, and the
+rewrites expected of it are checked against `Optimizer.stats`.
+"""
+
+import os
+from collections import Counter
+
+import pytest
+
+from bok.parser import Machine
+
+
+EXAMPLES_FILEN = os.path.join(os.path.dirname(__file__), os.pardir, 'lib',
+                              'examples.bok')
+
+with open(EXAMPLES_FILEN, 'r') as f:
+    EXAMPLES = f.read()
+
+# Programs as `(text, stats)`, where `stats` are the rewrites expected when
+# `text` is parsed and run after `lib/examples.bok`. Quotations are
+# optimized when they are first run, so those of branches not taken do not
+# count.
+PROGRAMS = [
+    # Constant folding, which cascades.
+    ('2 3 + 4 *', {'fold': 2}),
+    ('7 negate 2 **', {'fold': 2}),
+    ('1 0 /', {}),
+    ('2 100 **', {}),
+    ('5 3 > not', {'fold': 2}),
+    # Superinstructions.
+    ('3 dup *', {'square': 1}),
+    ('3 dup +', {'double': 1}),
+    ('1 2 swap drop', {'nip': 1}),
+    ('1 2 over +', {'over_plus': 1}),
+    ('1 2 3 drop drop', {'drop2': 1}),
+    ('4 dup 1 +', {'plus_one': 1}),
+    ('4 dup 1 -', {'minus_one': 1}),
+    # Conditionals with literal quotations.
+    ('3 [2 >] [2 *] [negate] if', {'fuse_if': 1}),
+    ('1 [2 >] [2 *] [negate] if', {'fuse_if': 1}),
+    ('5 [0 >] [dup *] when', {'fuse_when': 1, 'square': 1}),
+    ('-5 [0 >] [dup *] unless', {'fuse_unless': 1, 'square': 1}),
+    ('-2 [[[0 <] [negate]] [[0 ==] [1 +]]] cond', {'fuse_cond': 1}),
+    ('0 [[[0 <] [negate]] [[0 ==] [1 +]]] cond',
+     {'fuse_cond': 1, 'plus_one': 1}),
+    # Quotations that are data rather than code are left as they are.
+    ('[1 2 +] [dup *]', {}),
+    ('[1 2 3] [dup 1 -] map', {'minus_one': 1}),
+    # Words from `lib/examples.bok`, whose bodies are optimized when they
+    # are defined, so only rewrites in the quotations they run are counted.
+    ('5 square', {}),
+    ('10 factorial', {'minus_one': 1}),
+    ('10 factorial_naive', {'minus_one': 1}),
+    ('[1 2 3 4] dub_or_neg', {'fuse_if': 1}),
+    ('area 3 area.circle 2 4 area.triangle', {}),
+    ('2 assert_two', {}),
+    ('3 raise_err', {}),
+]
+
+
+def run(text, optimize):
+    """
+    Run `text` after `lib/examples.bok`, returning the final stack, or the
+    type of the error raised, and the rewrites made while parsing and
+    running `text` itself.
+    """
+    machine = Machine(optimize=optimize)
+    machine.parse(EXAMPLES)
+    before = Counter(machine.optimizer.stats) if optimize else Counter()
+    try:
+        machine.parse(text)
+        machine.run()
+        result = list(machine.stack)
+    except Exception as e:
+        result = type(e)
+    stats = machine.optimizer.stats - before if optimize else Counter()
+    return result, dict(stats)
+
+
+@pytest.mark.parametrize('text,stats', PROGRAMS)
+def test_same_stack(text, stats):
+    plain, _ = run(text, optimize=False)
+    optimized, rewrites = run(text, optimize=True)
+    assert optimized == plain
+    assert rewrites == stats
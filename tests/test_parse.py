@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Input parsed into a `Machine` is resolved against the names defined by
+earlier input, but only by input that was accepted.
+"""
+
+import pytest
+
+from bok.effects import StackEffectError
+from bok.parser import Machine
+
+
+def test_later_input_sees_earlier_names():
+    machine = Machine()
+    machine.parse('( ns ( inner 2 ) )')
+    machine.parse('( ns ( outer inner 1 + ) ) ns.outer')
+    machine.run()
+    assert list(machine.stack) == [3]
+
+
+def test_rejected_input_leaves_no_names():
+    machine = Machine()
+    machine.parse('( bad 10 )')
+    with pytest.raises(StackEffectError):
+        machine.parse('( ns ( bad d"( -- )" 1 ) )')
+    machine.parse('( ns ( c bad ) ) ns.c')
+    machine.run()
+    assert list(machine.stack) == [10]
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+`pmap` must leave what `map` would, falling back to it for quotations,
+values or results that cannot be sent between processes.
+"""
+
+import pytest
+
+from bok.parser import Machine
+
+
+PROGRAMS = [
+    '[1 2 3 4 5] [dup *]',
+    '( sq dup * ) [1 2 3 4 5] [sq 1 +]',
+    # Results that cannot be pickled: generators.
+    '[1 2 3] [list [2 *] lmap]',
+    # Values that cannot be pickled.
+    '[[1 2] [3 4]] [[2 *] lmap] map [collect]',
+]
+
+
+def run(text, word):
+    machine = Machine()
+    machine.parse('{0} {1}'.format(text, word))
+    machine.run()
+    return [
+        list(item) if hasattr(item, '__next__') else item
+        for item in machine.stack.pop()
+    ]
+
+
+@pytest.mark.parametrize('text', PROGRAMS)
+def test_same_as_map(text):
+    assert run(text, '2 pmapn') == run(text, 'map')
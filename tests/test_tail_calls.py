@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Self-calls in tail position run in a loop rather than recursing, unless
+the word has since been redefined.
+"""
+
+import pytest
+
+from bok.parser import Machine
+
+
+# Far deeper than Python's recursion limit allows for plain recursion.
+DEPTH = 50000
+
+COUNTDOWNS = [
+    '( cd [dup 0 >] [1 - cd] when )',
+    '( cd [dup 0 >] [1 - cd] [] if )',
+    '( cd [dup 0 <=] [] [1 - cd] if )',
+    '( cd [[[dup 0 >] [1 - cd]]] cond )',
+    '( cd 1 - [dup 0 >] [cd] when )',
+]
+
+
+def run(text, optimize=True):
+    machine = Machine(optimize=optimize)
+    machine.parse(text)
+    machine.run()
+    return list(machine.stack)
+
+
+@pytest.mark.parametrize('optimize', [True, False])
+@pytest.mark.parametrize('word', COUNTDOWNS)
+def test_deep_countdown(word, optimize):
+    assert run('{0} {1} cd'.format(word, DEPTH), optimize) == [0]
+
+
+def test_tail_call_after_redefinition():
+    machine = Machine()
+    machine.parse('( f [dup 0 >] [1 - f] when ) ( g f )')
+    machine.parse('( f 100 + ) 3 g')
+    machine.run()
+    assert list(machine.stack) == [102]
+
+
+def test_non_tail_recursion():
+    fib = '( fib [dup 2 <] [] [dup 1 - fib swap 2 - fib +] if )'
+    assert run(fib + ' 20 fib') == [6765]
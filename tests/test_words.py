@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Variables bound inside words: each invocation has its own, and only
+namespaces keep theirs once they return.
+"""
+
+import os
+import weakref
+
+from bok.parser import Machine
+
+
+EXAMPLES_FILEN = os.path.join(os.path.dirname(__file__), os.pardir, 'lib',
+                              'examples.bok')
+
+RECURSIVE_SUM = ':x x [0 >] [drop x 1 - f x +] [] if'
+
+
+def run(text):
+    machine = Machine()
+    machine.parse(text)
+    machine.run()
+    return list(machine.stack)
+
+
+def test_recursive_locals():
+    assert run('( f {0} ) 5 f'.format(RECURSIVE_SUM)) == [15]
+
+
+def test_nested_words_have_own_locals():
+    assert run('( g :x x 2 * ) ( h :x 1 g x + ) 10 h') == [12]
+
+
+class Big:
+    pass
+
+
+def test_locals_released_on_return():
+    machine = Machine()
+    machine.parse('( proc :big big drop 1 ) proc')
+    big = Big()
+    ref = weakref.ref(big)
+    machine.stack.push(big)
+    del big
+    machine.run()
+    assert list(machine.stack) == [1]
+    assert ref() is None
+
+
+def test_namespace_variables():
+    machine = Machine()
+    with open(EXAMPLES_FILEN, 'r') as f:
+        machine.parse(f.read())
+    machine.parse('area 3 area.circle 2 4 area.triangle')
+    machine.run()
+    assert list(machine.stack) == [3.14159 * 9, 4.0]
+
+
+def test_import_does_not_make_a_namespace(tmp_path, monkeypatch):
+    (tmp_path / 'd.bok').write_text('( one 1 )\n')
+    monkeypatch.chdir(tmp_path)
+    plain = run('( f {0} ) 5 f'.format(RECURSIVE_SUM))
+    with_import = run('( f "d" import {0} ) 5 f'.format(RECURSIVE_SUM))
+    assert plain == with_import == [15]